@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import pipeline_metrics as metrics
+from deribit_legs import LEG_COLUMNS, decode_trade
+from fetch_data import JsonRpcClient, JsonRpcError
+
+
+DERIBIT_WS_URI = 'wss://www.deribit.com/ws/api/v2'
+TRADES_METHOD = "public/get_last_trades_by_currency_and_time"
+MAX_PAGE_SIZE = 1000
+TOO_MANY_REQUESTS = 10028
+
+
+# Builds the params of one page request; Deribit treats both timestamps as inclusive.
+def create_trades_params(start_ms, end_ms, currency="BTC", count=MAX_PAGE_SIZE):
+    return {
+        "currency": currency,
+        "kind": "option",
+        "start_timestamp": int(start_ms),
+        "end_timestamp": int(end_ms),
+        "count": count,
+        "sorting": "asc",
+        "include_old": True,
+    }
+
+
+def _to_ms(date):
+    return int(pd.Timestamp(date, tz="UTC").timestamp() * 1000)
+
+
+# Splits [start_ms, end_ms) into fixed-size windows, each fetched and written independently.
+def split_windows(start_ms, end_ms, window_ms):
+    return [(s, min(s + window_ms, end_ms)) for s in range(start_ms, end_ms, window_ms)]
+
+
+def window_key(window):
+    return f"{window[0]}_{window[1]}"
+
+
+# Pages through one window with a (timestamp, trade ids seen at it) continuation cursor.
+async def fetch_window(client, start_ms, end_ms, currency="BTC", count=MAX_PAGE_SIZE, max_retries=5,
+                       on_page=None):
+    """
+    Fetch every option trade with start_ms <= timestamp < end_ms.
+
+    Deribit pages by time only, so the next page starts at the last timestamp
+    seen; trades already returned at that millisecond are skipped by id.
+
+    Parameters:
+        client (JsonRpcClient): Open connection shared with other windows.
+        max_retries (int): Attempts per page on too_many_requests; other errors are raised at once.
+        on_page (callable): Optional callback receiving each raw page result, e.g. to record it.
+
+    Returns:
+        tuple: (trades, pages, retries, overflows), overflows counting milliseconds
+        with more trades than fit on one page, whose excess cannot be fetched.
+    """
+    trades = []
+    cursor = start_ms
+    seen_at_cursor = set()
+    pages = retries = overflows = 0
+    while cursor < end_ms:
+        params = create_trades_params(cursor, end_ms - 1, currency, count)
+        for attempt in range(max_retries):
+            try:
+                result = await client.call(TRADES_METHOD, params)
+                break
+            except JsonRpcError as e:
+                if e.code != TOO_MANY_REQUESTS or attempt == max_retries - 1:
+                    raise
+                retries += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        pages += 1
+        if on_page is not None:
+            on_page(result)
+
+        page = result.get("trades", [])
+        new = [trade for trade in page if trade["trade_id"] not in seen_at_cursor]
+        trades.extend(new)
+        if not result.get("has_more") or not page:
+            break
+
+        last_ts = page[-1]["timestamp"]
+        if new:
+            if last_ts != cursor:
+                seen_at_cursor = set()
+            cursor = last_ts
+            seen_at_cursor.update(trade["trade_id"] for trade in page if trade["timestamp"] == last_ts)
+        else:
+            # A full page inside one millisecond cannot be paged further by time; move past it
+            cursor = last_ts + 1
+            seen_at_cursor = set()
+            overflows += 1
+    return trades, pages, retries, overflows
+
+
+# Converts raw Deribit trades into leg rows with the cleaned schema.
+def trades_to_legs(trades, block_only=False):
+    legs = []
+    for trade in trades:
+        if block_only and not trade.get("block_trade_id"):
+            continue
+        leg = decode_trade(trade)
+        if leg is not None:
+            legs.append(leg)
+    df = pd.DataFrame(legs, columns=LEG_COLUMNS)
+    for col in ("expiry", "current_date"):
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+
+# Atomically writes one window as day=YYYY-MM-DD/window_<start>_<end>.<fmt> below out_dir.
+def write_partition(df, out_dir, window, fmt="parquet"):
+    day = datetime.fromtimestamp(window[0] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+    directory = os.path.join(out_dir, f"day={day}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"window_{window_key(window)}.{fmt}")
+    tmp_path = f"{path}.tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return set(json.load(f).get("completed", []))
+
+
+def save_checkpoint(path, completed):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"completed": sorted(completed)}, f)
+    os.replace(tmp_path, path)
+
+
+# Fetches all windows of [start, end) concurrently and writes one partition per window.
+async def backfill(start, end, out_dir, uri=DERIBIT_WS_URI, currency="BTC", window_hours=6, concurrency=8,
+                   block_only=False, fmt="parquet", checkpoint_path=None, count=MAX_PAGE_SIZE, max_retries=5,
+                   record_path=None):
+    """
+    Backfill option trade history into columnar partitions.
+
+    Windows already listed in the checkpoint are skipped, so an interrupted run
+    resumes where it stopped. A window is checkpointed only after its partition
+    file is in place; windows that keep failing are left for the next run.
+
+    Parameters:
+        start, end (str): UTC dates or timestamps bounding the backfill, end exclusive.
+        out_dir (str): Root directory of the day=YYYY-MM-DD partitions; the key is not "date",
+            which would clash with the leg schema's own date column.
+        uri (str): Websocket endpoint, the stand-in server's address in tests.
+        window_hours (float): Size of each independently fetched window.
+        concurrency (int): Windows in flight at once over the shared connection.
+        block_only (bool): Keep only trades that carry a block_trade_id.
+        fmt (str): "parquet" or "pkl".
+        checkpoint_path (str): JSON checkpoint file, default out_dir/_checkpoint.json.
+        record_path (str): Optional JSONL file to record raw pages for the stand-in server.
+
+    Returns:
+        dict: Counts of windows, pages, trades and legs written.
+    """
+    checkpoint_path = checkpoint_path or os.path.join(out_dir, "_checkpoint.json")
+    os.makedirs(out_dir, exist_ok=True)
+    windows = split_windows(_to_ms(start), _to_ms(end), int(window_hours * 3600 * 1000))
+    completed = load_checkpoint(checkpoint_path)
+    todo = [window for window in windows if window_key(window) not in completed]
+    stats = {"windows": len(windows), "skipped": len(windows) - len(todo), "written": 0, "failed": 0,
+             "pages": 0, "trades": 0, "legs": 0}
+    record_file = open(record_path, "a", encoding="utf-8") if record_path else None
+    on_page = (lambda result: record_file.write(json.dumps(result) + "\n")) if record_file else None
+    semaphore = asyncio.Semaphore(concurrency)
+    clients = []
+    connect_lock = asyncio.Lock()
+
+    # Reopens the shared connection after a drop, so windows started later can still finish
+    async def get_client():
+        async with connect_lock:
+            if not clients or clients[-1].closed:
+                client = JsonRpcClient(uri)
+                await client.__aenter__()
+                clients.append(client)
+            return clients[-1]
+
+    # Windows run as concurrent coroutines in one thread, so failures go on the root span directly
+    with metrics.span("backfill") as backfill_span:
+        async def run_window(window):
+            try:
+                async with semaphore:
+                    client = await get_client()
+                    trades, pages, retries, overflows = await fetch_window(
+                        client, window[0], window[1], currency, count, max_retries, on_page)
+                legs = trades_to_legs(trades, block_only)
+                write_partition(legs, out_dir, window, fmt)
+            except Exception as e:
+                # Connection drops, server errors and write errors fail this window only
+                print(f"Window {window_key(window)} failed: {e}")
+                stats["failed"] += 1
+                reason = e.code if isinstance(e, JsonRpcError) else type(e).__name__
+                backfill_span.fail(f"window_error:{reason}")
+                return
+            completed.add(window_key(window))
+            save_checkpoint(checkpoint_path, completed)
+
+            stats["written"] += 1
+            stats["pages"] += pages
+            stats["trades"] += len(trades)
+            stats["legs"] += len(legs)
+            backfill_span.add_rows(len(legs))
+            if retries:
+                backfill_span.fail("page_retry", retries)
+            if overflows:
+                backfill_span.fail("page_overflow", overflows)
+            dropped = len(trades) - len(legs)
+            if dropped and not block_only:
+                backfill_span.fail("undecodable_trade", dropped)
+
+        try:
+            await asyncio.gather(*(run_window(window) for window in todo))
+        finally:
+            for client in clients:
+                await client.__aexit__(None, None, None)
+            if record_file is not None:
+                record_file.close()
+    return stats
+
+
+# Loads recorded pages (or plain trade objects), one JSON object per line, into a flat trade list.
+def load_recorded_trades(path):
+    trades = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record = record.get("result", record)
+            trades.extend(record["trades"] if "trades" in record else [record])
+    # Windows overlap at page boundaries, so the same trade can be recorded twice
+    unique = {trade["trade_id"]: trade for trade in trades}
+    return sorted(unique.values(), key=lambda trade: (trade["timestamp"], trade["trade_id"]))
+
+
+# Serves recorded trades through the paginated history method, for testing the backfill offline.
+async def serve_trade_history(trades, host="localhost", port=8766, ready=None, throttle_every=None):
+    """
+    Local stand-in for the Deribit history endpoint.
+
+    Parameters:
+        trades (list): Recorded trades, as returned by load_recorded_trades.
+        ready (asyncio.Future): Optional future resolved with the bound port once listening.
+        throttle_every (int): Answer every n-th request with too_many_requests to exercise retries.
+    """
+    import websockets
+
+    trades = sorted(trades, key=lambda trade: (trade["timestamp"], trade["trade_id"]))
+    timestamps = [trade["timestamp"] for trade in trades]
+    requests = 0
+
+    def page(params):
+        lo = bisect.bisect_left(timestamps, params["start_timestamp"])
+        hi = bisect.bisect_right(timestamps, params["end_timestamp"])
+        count = params.get("count", 10)
+        return {"trades": trades[lo:min(hi, lo + count)], "has_more": hi - lo > count}
+
+    async def handler(websocket):
+        nonlocal requests
+        async for raw in websocket:
+            request = json.loads(raw)
+            requests += 1
+            if throttle_every and requests % throttle_every == 0:
+                response = {"error": {"code": TOO_MANY_REQUESTS, "message": "too_many_requests"}}
+            elif request.get("method") == TRADES_METHOD:
+                response = {"result": page(request["params"])}
+            else:
+                response = {"error": {"code": -32601, "message": "Method not found"}}
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"), **response}))
+
+    async with websockets.serve(handler, host, port, max_size=None) as server:
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        await asyncio.Future()
+
+
+# Runs the backfill against a local stand-in server serving the given trades.
+async def replay_backfill(trades, throttle_every=None, **backfill_kwargs):
+    ready = asyncio.get_running_loop().create_future()
+    server = asyncio.create_task(serve_trade_history(trades, port=0, ready=ready, throttle_every=throttle_every))
+    try:
+        port = await ready
+        return await backfill(uri=f"ws://localhost:{port}", **backfill_kwargs)
+    finally:
+        server.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Deribit BTC option trade history into partitions.")
+    parser.add_argument("--start", default="2021-11-08")
+    parser.add_argument("--end", default="2024-11-09")
+    parser.add_argument("--output", default=os.path.join("data", "option_trades"))
+    parser.add_argument("--uri", default=DERIBIT_WS_URI)
+    parser.add_argument("--window-hours", type=float, default=6)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--block-only", action="store_true")
+    parser.add_argument("--format", choices=["parquet", "pkl"], default="parquet")
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--record", default=None, help="append raw pages to this JSONL file")
+    parser.add_argument("--replay", default=None, help="backfill from a recording through a local server")
+    args = parser.parse_args()
+
+    backfill_kwargs = dict(start=args.start, end=args.end, out_dir=args.output, window_hours=args.window_hours,
+                           concurrency=args.concurrency, block_only=args.block_only, fmt=args.format,
+                           checkpoint_path=args.checkpoint, record_path=args.record)
+    if args.replay:
+        stats = asyncio.run(replay_backfill(load_recorded_trades(args.replay), **backfill_kwargs))
+    else:
+        stats = asyncio.run(backfill(uri=args.uri, **backfill_kwargs))
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+
+HISTORY_PATH = os.path.join("data", "benchmark_history.jsonl")
+BASELINE_PATH = os.path.join("data", "benchmark_baseline.json")
+SCALES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+DEFAULT_SCALES = ["10k", "100k"]
+
+
+def _setup_parse(n, seed):
+    from synthetic_data import generate_telegram_messages
+    return generate_telegram_messages(n, seed=seed)
+
+
+def _run_parse(records):
+    from block_trade_data_clean import parse_trade_messages
+    return len(parse_trade_messages(records, verbose=False))
+
+
+def _setup_decode(n, seed):
+    from synthetic_data import generate_block_legs, _format_premiums
+    legs = generate_block_legs(n, seed=seed)
+    # Raw parser output: premiums still formatted strings such as "3.05K"
+    raw = legs[["id", "date", "date_unixtime", "contract_size", "action", "contract_name", "iv", "index_price"]].copy()
+    raw["premium"] = _format_premiums(legs["premium"].to_numpy())
+    return raw
+
+
+def _run_decode(df):
+    from block_trade_data_clean import decode_legs
+    return len(decode_legs(df))
+
+
+def _setup_legs(n, seed):
+    from synthetic_data import generate_block_legs
+    return generate_block_legs(n, seed=seed)
+
+
+def _run_forward(df):
+    from black76_model import parallel_forward_prices
+    return len(parallel_forward_prices(df))
+
+
+def _setup_priced_legs(n, seed):
+    legs = _setup_legs(n, seed)
+    legs["forward_price"] = legs["index_price"]
+    return legs
+
+
+def _run_greeks(df):
+    from black76_model import parallel_calculate_greeks
+    return len(parallel_calculate_greeks(df))
+
+
+def _run_greeks_array(df):
+    from black76_model import calculate_greeks_array, iv_to_sigma
+    greeks = calculate_greeks_array(df["forward_price"], df["strike"], df["risk_free_rate"],
+                                    df["time_to_maturity"], iv_to_sigma(df["iv"]), df["contract_size"],
+                                    (df["action"] == "Bought") * 2 - 1, df["type"] == "Call")
+    return len(greeks["Delta"])
+
+
+def _setup_bars(n, seed):
+    from synthetic_data import generate_ohlcv_bars
+    return generate_ohlcv_bars(n, seed=seed)
+
+
+def _run_rv(price_df):
+    from get_historical_data_v2 import calculate_realized_volatility
+    calculate_realized_volatility(price_df)
+    return len(price_df)
+
+
+def _setup_greek_legs(n, seed):
+    import numpy as np
+    legs = _setup_legs(n, seed)
+    rng = np.random.default_rng(seed)
+    for col in ("Delta", "Gamma", "Vega", "Theta"):
+        legs[col] = rng.normal(size=n)
+    return legs
+
+
+def _run_aggregate(df):
+    from var_model import aggregate_daily_greeks
+    aggregate_daily_greeks(df)
+    return len(df)
+
+
+def _setup_var(n, seed):
+    from synthetic_data import generate_var_frame
+    return generate_var_frame(n, seed=seed)
+
+
+def _run_var(df):
+    from var_model import fit_var
+    fit_var(df)
+    return len(df)
+
+
+# name: (setup(n, seed) -> input, run(input) -> rows processed, largest scale run by default)
+STAGES = {
+    "parse": (_setup_parse, _run_parse, 1_000_000),
+    "decode": (_setup_decode, _run_decode, 1_000_000),
+    "forward": (_setup_legs, _run_forward, 100_000),
+    "greeks": (_setup_priced_legs, _run_greeks, 1_000_000),
+    "greeks_array": (_setup_priced_legs, _run_greeks_array, 10_000_000),
+    "rv": (_setup_bars, _run_rv, 10_000_000),
+    "aggregate": (_setup_greek_legs, _run_aggregate, 10_000_000),
+    "var": (_setup_var, _run_var, 1_000_000),
+}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+# Runs one stage at one scale; executed in a fresh process so peak RSS belongs to this stage alone.
+def run_stage(stage, n, seed=0):
+    setup, run, _ = STAGES[stage]
+    inputs = setup(n, seed)
+    setup_rss = _peak_rss_mb()
+
+    cpu_start = _cpu_seconds()
+    start = time.perf_counter()
+    rows = run(inputs)
+    wall = time.perf_counter() - start
+    cpu = _cpu_seconds() - cpu_start
+
+    peak_rss = _peak_rss_mb()
+    return {
+        "stage": stage,
+        "scale": n,
+        "rows": rows,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "throughput_rows_per_s": rows / wall if wall > 0 else None,
+        "peak_rss_mb": peak_rss,
+        "stage_rss_mb": peak_rss - setup_rss if peak_rss is not None else None,
+    }
+
+
+def _run_isolated(stage, n, seed):
+    # ProcessPoolExecutor workers may start their own pools, unlike multiprocessing.Pool's daemons
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_stage, stage, n, seed).result()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Compares a run against the stored baseline; returns the results that got slower than tolerance allows.
+def find_regressions(results, baseline, tolerance=0.2):
+    regressions = []
+    for result in results:
+        reference = baseline.get(f"{result['stage']}@{result['scale']}")
+        if reference is None or not result.get("throughput_rows_per_s"):
+            continue
+        ratio = result["throughput_rows_per_s"] / reference["throughput_rows_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(dict(result, baseline_throughput=reference["throughput_rows_per_s"], ratio=ratio))
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[f"{result['stage']}@{result['scale']}"] = result
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+
+
+def append_history(results, path=HISTORY_PATH):
+    run = {
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def run_benchmarks(stages, scales, seed=0, no_cap=False, isolate=True):
+    """
+    Time each stage at each scale.
+
+    Parameters:
+        stages (list): Stage names from STAGES.
+        scales (list): Row counts.
+        no_cap (bool): Also run scales above a stage's default maximum (slow for fsolve and row-wise pools).
+        isolate (bool): Run every measurement in a fresh process so peak RSS is per stage.
+
+    Returns:
+        list: One result dict per stage and scale that was run.
+    """
+    results = []
+    for stage in stages:
+        max_scale = STAGES[stage][2]
+        for n in scales:
+            if n > max_scale and not no_cap:
+                print(f"{stage:>13} {n:>10,}  skipped (above default cap {max_scale:,}, use --no-cap)")
+                continue
+            result = _run_isolated(stage, n, seed) if isolate else run_stage(stage, n, seed)
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+            print(f"{stage:>13} {n:>10,}  {result['wall_s']:9.3f} s  "
+                  f"{result['throughput_rows_per_s']:14,.0f} rows/s  peak RSS {rss}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on seeded synthetic data.")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument("--full", action="store_true", help="run every scale from 10k to 10M")
+    parser.add_argument("--no-cap", action="store_true", help="ignore per-stage scale caps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional throughput drop")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    scales = [SCALES[s] for s in (list(SCALES) if args.full else args.scales)]
+    results = run_benchmarks(args.stages, scales, seed=args.seed, no_cap=args.no_cap)
+    append_history(results, args.history)
+
+    regressions = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r['stage']}@{r['scale']:,}: {r['throughput_rows_per_s']:,.0f} rows/s "
+              f"vs baseline {r['baseline_throughput']:,.0f} ({r['ratio']:.0%})")
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,13 @@ from scipy.optimize import fsolve
 from concurrent.futures import ProcessPoolExecutor
 import os
 
+import pipeline_metrics as metrics
+
+
+# Leg frames carry iv in percent, as Laevitas and Deribit quote it (57.4 for 57.4%); the model takes a decimal sigma.
+def iv_to_sigma(iv):
+    return iv / 100
+
 
 # Computes the `d1` and `d2` parameters used in Black-76 pricing formulas.
 def calculate_d1_d2(F, K, T, sigma):
@@ -39,37 +46,58 @@ def solve_forward_price(row_dict):
         K = row_dict["strike"]
         r = row_dict["risk_free_rate"]
         T = row_dict["time_to_maturity"]
-        sigma = row_dict["iv"]
+        sigma = iv_to_sigma(row_dict["iv"])
         option_type = row_dict["type"]
 
         # Initial guess
         F_initial_guess = K
 
         # Solve for forward price
-        F_solution = fsolve(objective, F_initial_guess, args=(market_price, K, r, T, sigma, option_type))[0]
-        return {"unique_id": row_dict["unique_id"], "forward_price": F_solution}
+        F_solution, _, ier, _ = fsolve(objective, F_initial_guess, args=(market_price, K, r, T, sigma, option_type),
+                                       full_output=True)
+        if ier != 1:
+            metrics.record_failure("fsolve_not_converged")
+        return {"unique_id": row_dict["unique_id"], "forward_price": F_solution[0]}
     except Exception as e:
-        print(f"Error solving forward price for row: {row_dict}, Error: {e}")
+        metrics.record_failure(f"error:{type(e).__name__}")
         return {"unique_id": row_dict["unique_id"], "forward_price": None}
 
 
+# Splits rows into about four chunks per worker so each task amortises the IPC overhead.
+def _chunk_rows(rows, chunksize=None):
+    if chunksize is None:
+        chunksize = max(1, -(-len(rows) // ((os.cpu_count() or 1) * 4)))
+    return [rows[i:i + chunksize] for i in range(0, len(rows), chunksize)]
+
+
+# Worker task: solves one chunk of rows and returns the results with the chunk's span.
+def _solve_forward_chunk(rows):
+    with metrics.span("forward_price.chunk", rows=len(rows), worker=True):
+        results = [solve_forward_price(row) for row in rows]
+    return results, metrics.drain()
+
+
 # Parallel computation of forward prices.
 def parallel_forward_prices(df):
     # Add a unique identifier for each row as a sequential number
     df = df.reset_index(drop=True)  # Reset index to ensure consistency
     df["unique_id"] = df.index.astype(int)  # Add unique_id based on index
 
-    # Convert DataFrame to list of dictionaries
-    data_dicts = df.to_dict(orient="records")
+    with metrics.span("forward_price", rows=len(df)):
+        # Convert DataFrame to list of dictionaries
+        data_dicts = df.to_dict(orient="records")
 
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(solve_forward_price, data_dicts))
+        results = []
+        with ProcessPoolExecutor() as executor:
+            for chunk_results, chunk_spans in executor.map(_solve_forward_chunk, _chunk_rows(data_dicts)):
+                results.extend(chunk_results)
+                metrics.collect(chunk_spans)
 
-    # Convert results back to DataFrame
-    results_df = pd.DataFrame(results)
+        # Convert results back to DataFrame
+        results_df = pd.DataFrame(results, columns=["unique_id", "forward_price"])
 
-    # Merge results with the original DataFrame on unique_id
-    df = df.merge(results_df, on="unique_id", how="left")
+        # Merge results with the original DataFrame on unique_id
+        df = df.merge(results_df, on="unique_id", how="left")
     return df
 
 
@@ -112,6 +140,41 @@ def calculate_greeks(F, K, r, T, sigma, contract_size, action, option_type="Call
     return {"Delta": delta, "Gamma": gamma, "Vega": vega, "Theta": daily_theta}
 
 
+# Vectorised Greeks over whole arrays of legs, same conventions as calculate_greeks.
+def calculate_greeks_array(F, K, r, T, sigma, contract_size, side, is_call):
+    """
+    Compute position-adjusted Greeks for arrays of legs in one pass.
+
+    Parameters:
+        F, K, r, T, sigma, contract_size (array-like): Black-76 inputs, one entry per leg.
+        side (array-like): +1 for Bought legs, -1 for Sold legs.
+        is_call (array-like of bool): True for calls, False for puts.
+
+    Returns:
+        dict: Arrays for "Delta", "Gamma", "Vega" and "Theta" (daily).
+    """
+    F, K, r, T, sigma = (np.asarray(x, dtype=float) for x in (F, K, r, T, sigma))
+    is_call = np.asarray(is_call, dtype=bool)
+    scale = np.asarray(contract_size, dtype=float) * np.asarray(side, dtype=float)
+
+    d1, _ = calculate_d1_d2(F, K, T, sigma)
+    discount = np.exp(-r * T)
+    sqrt_t = np.sqrt(T)
+    cdf_d1 = norm.cdf(d1)
+    pdf_d1 = norm.pdf(d1)
+
+    delta = np.where(is_call, discount * cdf_d1, discount * (cdf_d1 - 1))
+    gamma = discount * pdf_d1 / (F * sigma * sqrt_t)
+    vega = F * discount * pdf_d1 * sqrt_t
+    decay = -F * pdf_d1 * sigma * discount / (2 * sqrt_t)
+    yearly_theta = np.where(is_call,
+                            decay - r * F * cdf_d1 * discount,
+                            decay + r * F * (1 - cdf_d1) * discount)
+
+    return {"Delta": delta * scale, "Gamma": gamma * scale, "Vega": vega * scale,
+            "Theta": yearly_theta / 365 * scale}
+
+
 # Function to process a single row
 def process_row(row_dict):
     try:
@@ -119,36 +182,49 @@ def process_row(row_dict):
         K = row_dict["strike"]
         r = row_dict["risk_free_rate"]
         T = row_dict["time_to_maturity"]
-        sigma = row_dict["iv"]
+        sigma = iv_to_sigma(row_dict["iv"])
         contract_size = row_dict["contract_size"]
         action = row_dict["action"]
         option_type = row_dict["type"]
 
         # Calculate Greeks
         greeks = calculate_greeks(F, K, r, T, sigma, contract_size, action, option_type)
+        if not np.isfinite(list(greeks.values())).all():
+            metrics.record_failure("non_finite_greeks")
         greeks["unique_id"] = row_dict["unique_id"]
         return greeks
     except Exception as e:
-        print(f"Error processing row: {row_dict}, Error: {e}")
+        metrics.record_failure(f"error:{type(e).__name__}")
         return {"unique_id": row_dict["unique_id"], "Delta": None, "Gamma": None, "Vega": None, "Theta": None}
 
+
+# Worker task: computes Greeks for one chunk of rows and returns the results with the chunk's span.
+def _process_chunk(rows):
+    with metrics.span("greeks.chunk", rows=len(rows), worker=True):
+        results = [process_row(row) for row in rows]
+    return results, metrics.drain()
+
 # Parallel computation of Greeks
 def parallel_calculate_greeks(df):
     # Ensure unique identifiers for each row
     df = df.reset_index(drop=True)
     df["unique_id"] = df.index
 
-    # Convert DataFrame to list of dictionaries
-    data_dicts = df.to_dict(orient="records")
+    with metrics.span("greeks", rows=len(df)):
+        # Convert DataFrame to list of dictionaries
+        data_dicts = df.to_dict(orient="records")
 
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(process_row, data_dicts))
+        results = []
+        with ProcessPoolExecutor() as executor:
+            for chunk_results, chunk_spans in executor.map(_process_chunk, _chunk_rows(data_dicts)):
+                results.extend(chunk_results)
+                metrics.collect(chunk_spans)
 
-    # Convert results back to DataFrame
-    results_df = pd.DataFrame(results)
+        # Convert results back to DataFrame
+        results_df = pd.DataFrame(results, columns=["unique_id", "Delta", "Gamma", "Vega", "Theta"])
 
-    # Merge results with the original DataFrame on unique_id
-    df = df.merge(results_df, on="unique_id", how="left")
+        # Merge results with the original DataFrame on unique_id
+        df = df.merge(results_df, on="unique_id", how="left")
     return df
 
 
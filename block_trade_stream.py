@@ -0,0 +1,504 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import numpy as np
+import websockets
+
+import pipeline_metrics as metrics
+from black76_model import calculate_greeks_array, iv_to_sigma
+from deribit_legs import decode_trade
+
+
+DERIBIT_WS_URI = 'wss://www.deribit.com/ws/api/v2'
+DEFAULT_CHANNELS = ["trades.option.BTC.100ms"]
+
+
+# Builds the public/subscribe request for the given channels.
+def create_subscribe_message(channels):
+    return {
+        "jsonrpc": "2.0",
+        "id": 4235,
+        "method": "public/subscribe",
+        "params": {
+            "channels": list(channels)
+        }
+    }
+
+
+# Asks the server to send heartbeats so dead connections are noticed quickly.
+def create_heartbeat_message(interval=30):
+    return {
+        "jsonrpc": "2.0",
+        "id": 9098,
+        "method": "public/set_heartbeat",
+        "params": {
+            "interval": interval
+        }
+    }
+
+
+# Reply to a heartbeat test_request.
+def create_test_message():
+    return {
+        "jsonrpc": "2.0",
+        "id": 8212,
+        "method": "public/test",
+        "params": {}
+    }
+
+
+# Computes Greeks for a micro-batch of decoded legs with the array kernels.
+def calculate_batch_greeks(legs):
+    """
+    Price a list of leg records in one vectorised call.
+
+    The underlying price reported with the trade is used as the forward, since
+    Deribit options settle against it and the repo assumes a zero rate.
+
+    Returns:
+        dict: Arrays for "Delta", "Gamma", "Vega" and "Theta" aligned with legs.
+    """
+    iv = np.array([np.nan if leg["iv"] is None else leg["iv"] for leg in legs], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return calculate_greeks_array(
+            F=[leg["underlying_price"] for leg in legs],
+            K=[leg["strike"] for leg in legs],
+            r=[leg["risk_free_rate"] for leg in legs],
+            T=[leg["time_to_maturity"] for leg in legs],
+            sigma=iv_to_sigma(iv),
+            contract_size=[leg["contract_size"] for leg in legs],
+            side=[1 if leg["action"] == "Bought" else -1 for leg in legs],
+            is_call=[leg["type"] == "Call" for leg in legs],
+        )
+
+
+class IntradayAggregates:
+    """
+    Running intraday net Greeks and notional, updated in O(1) per leg.
+
+    Totals reset when a leg arrives for a later UTC trading day; the closing
+    day's final totals are kept as previous_day. Stragglers from an earlier day
+    are dropped and counted in late_legs.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.previous_day = None
+        self.late_legs = 0
+        self.reset()
+
+    def reset(self):
+        self.trades = 0
+        self.block_trades = 0
+        self.net_delta = 0.0
+        self.net_gamma = 0.0
+        self.net_vega = 0.0
+        self.net_theta = 0.0
+        self.notional = 0.0
+        self.net_premium = 0.0
+
+    # Returns False when the leg belongs to a day that has already rolled over.
+    def update(self, day, delta, gamma, vega, theta, notional, net_premium, is_block=False):
+        if self.day is not None and day < self.day:
+            self.late_legs += 1
+            return False
+        if day != self.day:
+            if self.day is not None:
+                self.previous_day = self._totals()
+            self.day = day
+            self.reset()
+        self.trades += 1
+        self.block_trades += int(is_block)
+        self.net_delta += delta
+        self.net_gamma += gamma
+        self.net_vega += vega
+        self.net_theta += theta
+        self.notional += notional
+        self.net_premium += net_premium
+        return True
+
+    def snapshot(self):
+        snapshot = self._totals()
+        snapshot["late_legs"] = self.late_legs
+        snapshot["previous_day"] = self.previous_day
+        return snapshot
+
+    def _totals(self):
+        return {
+            "day": self.day.isoformat() if self.day is not None else None,
+            "trades": self.trades,
+            "block_trades": self.block_trades,
+            "net_delta": self.net_delta,
+            "net_gamma": self.net_gamma,
+            "net_vega": self.net_vega,
+            "net_theta": self.net_theta,
+            "notional": self.notional,
+            "net_premium": self.net_premium,
+        }
+
+
+class LatencyTracker:
+    """
+    End-to-end latency (exchange timestamp to aggregates updated) over a sliding window.
+    """
+
+    def __init__(self, window=4096):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.max_ms = 0.0
+
+    def add(self, latency_ms):
+        self.samples.append(latency_ms)
+        self.count += 1
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def snapshot(self):
+        if not self.samples:
+            return {"count": self.count, "p50_ms": None, "p99_ms": None, "max_ms": None}
+        p50, p99 = np.percentile(np.fromiter(self.samples, dtype=float), [50, 99])
+        return {"count": self.count, "p50_ms": float(p50), "p99_ms": float(p99), "max_ms": self.max_ms}
+
+
+# Writes a snapshot as JSON so readers never see a half-written file.
+def publish_snapshot(snapshot, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, default=str)
+    os.replace(tmp_path, path)
+
+
+class TradeStreamConsumer:
+    """
+    Subscribes to Deribit option trades, prices legs in micro-batches and
+    publishes rolling intraday aggregates with latency metrics.
+
+    Parameters:
+        uri (str): Websocket endpoint, the replay server's address in tests.
+        channels (list): Channels to subscribe to.
+        snapshot_path (str): JSON file rewritten with the latest snapshot, or None.
+        block_only (bool): Keep only legs that carry a block_trade_id.
+        batch_size (int): Maximum legs per micro-batch.
+        batch_interval (float): Seconds to wait for a micro-batch to fill.
+        snapshot_interval (float): Minimum seconds between snapshot publications.
+        reconnect (bool): Reconnect after the connection drops instead of returning.
+        record_path (str): Optional JSONL file to record raw messages for later replay.
+        on_snapshot (callable): Optional callback receiving each published snapshot.
+        queue_size (int): Maximum decoded legs waiting for the processor; a full queue
+            makes the reader wait, so a slow processor pushes back on the connection.
+    """
+
+    def __init__(self, uri=DERIBIT_WS_URI, channels=None, snapshot_path=None, block_only=False,
+                 batch_size=256, batch_interval=0.05, snapshot_interval=1.0, reconnect=True,
+                 record_path=None, on_snapshot=None, queue_size=10_000):
+        self.uri = uri
+        self.channels = list(channels or DEFAULT_CHANNELS)
+        self.snapshot_path = snapshot_path
+        self.block_only = block_only
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.snapshot_interval = snapshot_interval
+        self.reconnect = reconnect
+        self.record_path = record_path
+        self.on_snapshot = on_snapshot
+        self.queue_size = queue_size
+
+        self.aggregates = IntradayAggregates()
+        self.latency = LatencyTracker()
+        self.failed_legs = 0
+        self.failures = Counter()
+        self.batches = 0
+        self._last_publish = 0.0
+        self._stopped = asyncio.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def run(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        processor = asyncio.create_task(self._process(queue))
+        reader = asyncio.create_task(self._read_loop(queue))
+        try:
+            await asyncio.wait({reader, processor}, return_when=asyncio.FIRST_COMPLETED)
+            if processor.done():
+                # The processor only returns after the end-of-stream marker, so it has died: fail fast
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+                processor.result()
+            else:
+                end = asyncio.ensure_future(queue.put(None))
+                await asyncio.wait({end, processor}, return_when=asyncio.FIRST_COMPLETED)
+                end.cancel()
+                await processor
+                reader.result()
+        finally:
+            reader.cancel()
+            processor.cancel()
+        return self.snapshot()
+
+    # Reads until stopped, reconnecting with backoff unless reconnect is off.
+    async def _read_loop(self, queue):
+        backoff = 1.0
+        while not self._stopped.is_set():
+            try:
+                await self._read(queue)
+                backoff = 1.0
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                print(f"Trade stream connection error: {e}")
+            if not self.reconnect or self._stopped.is_set():
+                break
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _read(self, queue):
+        record_file = open(self.record_path, "a", encoding="utf-8") if self.record_path else None
+        try:
+            async with websockets.connect(self.uri) as websocket:
+                await websocket.send(json.dumps(create_subscribe_message(self.channels)))
+                await websocket.send(json.dumps(create_heartbeat_message()))
+                stop_task = asyncio.create_task(self._stopped.wait())
+                recv_task = None
+                try:
+                    while True:
+                        recv_task = asyncio.create_task(websocket.recv())
+                        done, _ = await asyncio.wait({recv_task, stop_task},
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                        if recv_task not in done:
+                            recv_task.cancel()
+                            return
+                        try:
+                            raw = recv_task.result()
+                        except websockets.exceptions.ConnectionClosedOK:
+                            return
+                        received_ms = int(time.time() * 1000)
+                        if record_file is not None:
+                            record_file.write(raw + "\n" if isinstance(raw, str) else raw.decode() + "\n")
+                        await self._dispatch(websocket, json.loads(raw), received_ms, queue)
+                finally:
+                    stop_task.cancel()
+                    if recv_task is not None:
+                        recv_task.cancel()
+        finally:
+            if record_file is not None:
+                record_file.close()
+
+    async def _dispatch(self, websocket, message, received_ms, queue):
+        method = message.get("method")
+        if method == "heartbeat":
+            if message.get("params", {}).get("type") == "test_request":
+                await websocket.send(json.dumps(create_test_message()))
+            return
+        if method != "subscription":
+            if "error" in message:
+                print(f"Trade stream error response: {message['error']}")
+            return
+        for trade in message.get("params", {}).get("data", []):
+            if self.block_only and not trade.get("block_trade_id"):
+                continue
+            try:
+                leg = decode_trade(trade, received_ms)
+            except (KeyError, TypeError, ValueError) as e:
+                # One malformed trade must not take the stream down
+                self.failed_legs += 1
+                self.failures[f"decode_error:{type(e).__name__}"] += 1
+                continue
+            if leg is not None:
+                await queue.put(leg)
+
+    async def _process(self, queue):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            leg = await queue.get()
+            if leg is None:
+                break
+            batch = [leg]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                # Drain what is already queued before waiting on the clock
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        leg = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    leg = queue.get_nowait()
+                if leg is None:
+                    finished = True
+                    break
+                batch.append(leg)
+            self.handle_batch(batch)
+        self.publish(force=True)
+
+    def handle_batch(self, legs):
+        with metrics.span("stream.batch", rows=len(legs)) as batch_span:
+            self._update_aggregates(legs, batch_span)
+        self.batches += 1
+        self.publish()
+
+    def _update_aggregates(self, legs, batch_span):
+        greeks = calculate_batch_greeks(legs)
+        processed_ms = time.time() * 1000
+        for i, leg in enumerate(legs):
+            delta, gamma, vega, theta = (greeks[k][i] for k in ("Delta", "Gamma", "Vega", "Theta"))
+            if not np.isfinite([delta, gamma, vega, theta]).all():
+                self.failed_legs += 1
+                self.failures["non_finite_greeks"] += 1
+                batch_span.fail("non_finite_greeks")
+                continue
+            side = 1 if leg["action"] == "Bought" else -1
+            day = leg["current_date"].date()
+            if self.aggregates.day is not None and day > self.aggregates.day:
+                # Snapshots are throttled; publish the closing day's final totals before they reset
+                self.publish(force=True)
+            updated = self.aggregates.update(
+                day=day,
+                delta=float(delta), gamma=float(gamma), vega=float(vega), theta=float(theta),
+                notional=leg["contract_size"] * leg["index_price"],
+                net_premium=side * leg["contract_size"] * leg["premium"],
+                is_block=bool(leg["block_trade_id"]),
+            )
+            if not updated:
+                batch_span.fail("late_leg")
+                continue
+            self.latency.add(processed_ms - (leg["replay_sent_ms"] or leg["exchange_ms"]))
+
+    def snapshot(self):
+        snapshot = self.aggregates.snapshot()
+        snapshot["failed_legs"] = self.failed_legs
+        snapshot["failures"] = dict(self.failures)
+        snapshot["batches"] = self.batches
+        snapshot["latency"] = self.latency.snapshot()
+        snapshot["published_at"] = datetime.now(timezone.utc).isoformat()
+        return snapshot
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < self.snapshot_interval:
+            return
+        self._last_publish = now
+        snapshot = self.snapshot()
+        if self.snapshot_path:
+            publish_snapshot(snapshot, self.snapshot_path)
+        if self.on_snapshot is not None:
+            self.on_snapshot(snapshot)
+
+
+# Loads messages written by TradeStreamConsumer(record_path=...), one JSON message per line.
+def load_recorded_messages(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Serves recorded subscription messages to any client that subscribes, at accelerated speed.
+async def serve_replay(messages, host="localhost", port=8765, speed=10.0, ready=None):
+    """
+    Local stand-in for the Deribit websocket used to test the consumer offline.
+
+    Recorded gaps between trades are divided by `speed`. Trades keep their
+    recorded timestamp, which prices them; the send time is added as
+    `replay_sent_ms` so latency metrics measure this pipeline, not the age of
+    the recording. The connection is closed once all messages are sent.
+
+    Parameters:
+        messages (list): Recorded messages, as returned by load_recorded_messages.
+        ready (asyncio.Future): Optional future resolved with the bound port once listening.
+    """
+    notifications = [m for m in messages if m.get("method") == "subscription"]
+
+    async def handler(websocket):
+        async for raw in websocket:
+            request = json.loads(raw)
+            if request.get("method") == "public/subscribe":
+                await websocket.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"),
+                                                 "result": request["params"]["channels"]}))
+                break
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": "ok"}))
+
+        first_ts = None
+        start = time.time() * 1000
+        for message in notifications:
+            data = message["params"].get("data", [])
+            if data:
+                ts = data[0]["timestamp"]
+                first_ts = ts if first_ts is None else first_ts
+                wait_ms = (ts - first_ts) / speed - (time.time() * 1000 - start)
+                if wait_ms > 0:
+                    await asyncio.sleep(wait_ms / 1000)
+            now_ms = int(time.time() * 1000)
+            stamped = [dict(trade, replay_sent_ms=now_ms) for trade in data]
+            await websocket.send(json.dumps({**message, "params": {**message["params"], "data": stamped}}))
+        await websocket.close()
+
+    async with websockets.serve(handler, host, port) as server:
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        await asyncio.Future()
+
+
+# Replays a recording through a local server and consumes it, returning the final snapshot.
+async def replay_and_consume(messages, speed=10.0, **consumer_kwargs):
+    ready = asyncio.get_running_loop().create_future()
+    server = asyncio.create_task(serve_replay(messages, port=0, speed=speed, ready=ready))
+    try:
+        port = await ready
+        consumer = TradeStreamConsumer(uri=f"ws://localhost:{port}", reconnect=False, **consumer_kwargs)
+        return await consumer.run()
+    finally:
+        server.cancel()
+
+
+# Replays trades recorded on 2024-12-13 on an option that has since expired; all of them must price.
+def check_replay():
+    recorded_ms = int(datetime(2024, 12, 13, 12, tzinfo=timezone.utc).timestamp() * 1000)
+    trades = [{"trade_id": f"R{i}", "instrument_name": "BTC-20DEC24-100000-C", "timestamp": recorded_ms + i * 1000,
+               "price": 0.02, "index_price": 100000.0, "iv": 55.0, "amount": 1.0,
+               "direction": "buy" if i % 2 else "sell"} for i in range(5)]
+    messages = [{"jsonrpc": "2.0", "method": "subscription",
+                 "params": {"channel": DEFAULT_CHANNELS[0], "data": [trade]}} for trade in trades]
+    snapshot = asyncio.run(replay_and_consume(messages, speed=1000.0))
+    if snapshot["failed_legs"] or snapshot["trades"] != len(trades) or snapshot["day"] != "2024-12-13":
+        raise RuntimeError(f"Replay check failed: {snapshot}")
+    if snapshot["latency"]["max_ms"] > 60_000:
+        raise RuntimeError(f"Replay latency measured from the recording time: {snapshot['latency']}")
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream Deribit BTC option trades into rolling Greek aggregates.")
+    parser.add_argument("--uri", default=DERIBIT_WS_URI)
+    parser.add_argument("--channel", action="append", dest="channels")
+    parser.add_argument("--snapshot", default=os.path.join("data", "stream_snapshot.json"))
+    parser.add_argument("--block-only", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--batch-interval", type=float, default=0.05)
+    parser.add_argument("--record", default=None, help="append raw messages to this JSONL file")
+    parser.add_argument("--replay", default=None, help="consume a recording through a local replay server")
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("--self-check", action="store_true", help="replay a built-in recording and verify it prices")
+    args = parser.parse_args()
+
+    if args.self_check:
+        print(json.dumps(check_replay(), indent=2, default=str))
+        return
+
+    consumer_kwargs = dict(channels=args.channels, snapshot_path=args.snapshot, block_only=args.block_only,
+                           batch_size=args.batch_size, batch_interval=args.batch_interval)
+    if args.replay:
+        snapshot = asyncio.run(replay_and_consume(load_recorded_messages(args.replay), args.speed,
+                                                  **consumer_kwargs))
+    else:
+        snapshot = asyncio.run(TradeStreamConsumer(uri=args.uri, record_path=args.record,
+                                                   **consumer_kwargs).run())
+    print(json.dumps(snapshot, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Single entry point for the research pipeline.
+
+    python btc_pipeline.py fetch --start 2021-11-08 --end 2024-11-09
+    python btc_pipeline.py clean + price + greeks + aggregate
+    python btc_pipeline.py --metrics-jsonl data/metrics.jsonl rv + var
+
+Stages joined with "+" run in one interpreter and hand their DataFrames to the
+next stage in memory; each stage still writes its output file. Heavy libraries
+(pandas, scipy, websockets, telethon) are imported inside the stage that needs
+them, so `--help` and light commands start quickly.
+"""
+import argparse
+import os
+import sys
+
+
+DATA_DIR = "data"
+CHAIN_SEPARATOR = "+"
+PRICE_RESOLUTION = "5"
+
+
+def _data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+# Intraday bar file for a Deribit resolution, named like data/price_df_5min.csv; shared by fetch and rv.
+def _price_path(resolution=PRICE_RESOLUTION):
+    return _data_path(f"price_df_{resolution}min.csv" if resolution.isdigit() else f"price_df_{resolution}.csv")
+
+
+def _read_frame(path):
+    import pandas as pd
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_frame(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    elif path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_pickle(path)
+    print(f"Wrote {len(df)} rows to {path}")
+
+
+# An explicit --input wins, then the previous stage's output in this run, then the default file.
+def _input_frame(path, context, key, default_path):
+    if path is None and key in context:
+        return context[key]
+    return _read_frame(path or default_path)
+
+
+def cmd_fetch(args, context):
+    if args.dvol:
+        from get_historical_data import fetch_dvol_data
+        df = fetch_dvol_data(args.start, args.end, resolution=args.resolution or "1D")
+        context["dvol"] = df
+        _write_frame(df, args.output or _data_path("dvol_df.csv"))
+    else:
+        from get_historical_data_v2 import fetch_btc_data
+        resolution = args.resolution or PRICE_RESOLUTION
+        df = fetch_btc_data(args.start, args.end, instrument_name=args.instrument, resolution=resolution)
+        context["prices"] = df
+        _write_frame(df, args.output or _price_path(resolution))
+
+
+def cmd_backfill(args, context):
+    import asyncio
+    import json
+    from backfill_option_trades import backfill, load_recorded_trades, replay_backfill
+
+    backfill_kwargs = dict(start=args.start, end=args.end, out_dir=args.output, window_hours=args.window_hours,
+                           concurrency=args.concurrency, block_only=args.block_only, fmt=args.format,
+                           record_path=args.record)
+    if args.replay:
+        stats = asyncio.run(replay_backfill(load_recorded_trades(args.replay), **backfill_kwargs))
+    else:
+        stats = asyncio.run(backfill(**backfill_kwargs))
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_scrape(args, context):
+    from tg_bot import scrape_messages
+    scrape_messages(args.group)
+
+
+def cmd_clean(args, context):
+    from block_trade_data_clean import clean_block_trades
+    df = clean_block_trades(args.input or _data_path("result.json"), verbose=args.verbose)
+    context["legs"] = df
+    _write_frame(df, args.output or _data_path("block_trade.pkl"))
+
+
+def cmd_price(args, context):
+    from black76_model import parallel_forward_prices
+    df = parallel_forward_prices(_input_frame(args.input, context, "legs", _data_path("block_trade.pkl")))
+    context["legs"] = df
+    _write_frame(df, args.output or _data_path("block_trade_with_forward_prices.pkl"))
+
+
+def cmd_greeks(args, context):
+    from black76_model import parallel_calculate_greeks
+    df = parallel_calculate_greeks(_input_frame(args.input, context, "legs",
+                                                _data_path("block_trade_with_forward_prices.pkl")))
+    context["legs"] = df
+    _write_frame(df, args.output or _data_path("block_trade_with_greeks.pkl"))
+
+
+def cmd_rv(args, context):
+    from get_historical_data_v2 import calculate_realized_volatility
+    df = calculate_realized_volatility(_input_frame(args.input, context, "prices", _price_path()))
+    context["volatility"] = df
+    _write_frame(df, args.output or _data_path("daily_realized_volatility.csv"))
+
+
+def cmd_aggregate(args, context):
+    from var_model import aggregate_daily_greeks
+    df = aggregate_daily_greeks(_input_frame(args.input, context, "legs", _data_path("block_trade_with_greeks.pkl")))
+    context["aggregated"] = df
+    # File name as read by BtcVARModel.R
+    _write_frame(df, args.output or _data_path("aggregated_greeeks.csv"))
+
+
+def cmd_var(args, context):
+    from var_model import build_var_frame, fit_var
+    var_df = build_var_frame(
+        _read_frame(args.prices),
+        _input_frame(args.volatility, context, "volatility", _data_path("daily_realized_volatility.csv")),
+        _input_frame(args.dvol, context, "dvol", _data_path("dvol_df.csv")),
+        _input_frame(args.greeks, context, "aggregated", _data_path("aggregated_greeeks.csv")),
+    )
+    result = fit_var(var_df, p=args.lags)
+    table = result["coef"].round(4).astype(str) + "\n(" + result["t_values"].round(4).astype(str) + ")"
+    print(result["coef"].round(4))
+    print("Companion root moduli:", result["roots"].round(4))
+    output = args.output or "transposed_var_model_results.csv"
+    table.to_csv(output, index=True)
+    print(f"Wrote VAR({args.lags}) coefficients to {output}")
+
+
+def cmd_stats(args, context):
+    from summary_stats import summarize_statistics
+    if args.input:
+        # A single directory argument means every partition file below it
+        partitions = args.input[0] if len(args.input) == 1 and os.path.isdir(args.input[0]) else args.input
+    elif "legs" in context:
+        partitions = [context["legs"]]
+    else:
+        partitions = [_data_path("block_trade_with_greeks.pkl")]
+    summary = summarize_statistics(partitions, args.columns, max_workers=args.workers, seed=args.seed)
+    print(summary.T)
+    if args.output:
+        summary.T.to_csv(args.output, index=True)
+
+
+def cmd_stream(args, context):
+    import asyncio
+    import json
+    from block_trade_stream import TradeStreamConsumer, load_recorded_messages, replay_and_consume
+
+    consumer_kwargs = dict(snapshot_path=args.snapshot, block_only=args.block_only)
+    if args.replay:
+        snapshot = asyncio.run(replay_and_consume(load_recorded_messages(args.replay), args.speed,
+                                                  **consumer_kwargs))
+    else:
+        snapshot = asyncio.run(TradeStreamConsumer(record_path=args.record, **consumer_kwargs).run())
+    print(json.dumps(snapshot, indent=2, default=str))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="btc_pipeline.py",
+        description="BTC option block trade research pipeline. Chain stages with ' + '.",
+    )
+    parser.add_argument("--metrics-jsonl", help="append span metrics to this JSONL file")
+    parser.add_argument("--metrics-prom", help="write Prometheus text metrics to this file")
+    parser.add_argument("--profile", action="store_true", help="attach a sampling profile to each stage")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    p = sub.add_parser("fetch", help="download Deribit OHLC (or DVOL) history")
+    p.add_argument("--start", default="2021-11-08")
+    p.add_argument("--end", default="2024-11-09")
+    p.add_argument("--instrument", default="BTC-PERPETUAL")
+    p.add_argument("--resolution", help="bar size, default 5 (minutes) for prices and 1D for DVOL")
+    p.add_argument("--dvol", action="store_true", help="fetch the BTC DVOL index instead of prices")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_fetch)
+
+    p = sub.add_parser("backfill", help="page Deribit option trade history into partitions")
+    p.add_argument("--start", default="2021-11-08")
+    p.add_argument("--end", default="2024-11-09")
+    p.add_argument("--output", default=_data_path("option_trades"))
+    p.add_argument("--window-hours", type=float, default=6)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--block-only", action="store_true")
+    p.add_argument("--format", choices=["parquet", "pkl"], default="parquet")
+    p.add_argument("--record", help="append raw pages to this JSONL file")
+    p.add_argument("--replay", help="backfill from a recording through a local server")
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser("scrape", help="store Laevitas Telegram messages in PostgreSQL")
+    p.add_argument("--group", default="@laevitas")
+    p.set_defaults(func=cmd_scrape)
+
+    p = sub.add_parser("clean", help="parse the Telegram export into block-trade legs")
+    p.add_argument("--input", help="Telegram JSON export (default data/result.json)")
+    p.add_argument("--output")
+    p.add_argument("--verbose", action="store_true", help="print every parsed record")
+    p.set_defaults(func=cmd_clean)
+
+    p = sub.add_parser("price", help="solve implied forward prices")
+    p.add_argument("--input")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_price)
+
+    p = sub.add_parser("greeks", help="compute position Greeks per leg")
+    p.add_argument("--input")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_greeks)
+
+    p = sub.add_parser("rv", help="daily realized volatility from intraday bars")
+    p.add_argument("--input")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_rv)
+
+    p = sub.add_parser("aggregate", help="sum leg Greeks per day")
+    p.add_argument("--input")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_aggregate)
+
+    p = sub.add_parser("var", help="fit the VAR model of BtcVARModel.R")
+    p.add_argument("--prices", default=_data_path("daily_price_ohlc.csv"))
+    p.add_argument("--volatility", help="default: the rv stage's output, else data/daily_realized_volatility.csv")
+    p.add_argument("--dvol", help="default: the fetch --dvol stage's output, else data/dvol_df.csv")
+    p.add_argument("--greeks", help="default: the aggregate stage's output, else data/aggregated_greeeks.csv")
+    p.add_argument("--lags", type=int, default=1)
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_var)
+
+    p = sub.add_parser("stats", help="out-of-core summary statistics")
+    p.add_argument("--input", nargs="+", help="partition files or a directory of partitions")
+    p.add_argument("--columns", nargs="+",
+                   default=["contract_size", "premium", "time_to_maturity", "Delta", "Gamma", "Vega"])
+    p.add_argument("--workers", type=int)
+    p.add_argument("--seed", type=int, default=0, help="quantile sketch seed")
+    p.add_argument("--output")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("stream", help="live trade stream with rolling Greek aggregates")
+    p.add_argument("--snapshot", default=_data_path("stream_snapshot.json"))
+    p.add_argument("--block-only", action="store_true")
+    p.add_argument("--record")
+    p.add_argument("--replay")
+    p.add_argument("--speed", type=float, default=10.0)
+    p.set_defaults(func=cmd_stream)
+
+    return parser
+
+
+# Splits "a --x 1 + b + c" into one argv per stage.
+def split_chain(argv):
+    segments = [[]]
+    for token in argv:
+        if token == CHAIN_SEPARATOR:
+            segments.append([])
+        else:
+            segments[-1].append(token)
+    return [segment for segment in segments if segment]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    segments = split_chain(argv) or [[]]
+    stages = [parser.parse_args(segments[0])]
+    # Global options given before the first stage apply to the whole chain
+    globals_ = {k: v for k, v in vars(stages[0]).items() if k in ("metrics_jsonl", "metrics_prom", "profile")}
+    stages += [parser.parse_args(segment) for segment in segments[1:]]
+
+    import pipeline_metrics as metrics
+    metrics.configure(jsonl_path=globals_["metrics_jsonl"], prometheus_path=globals_["metrics_prom"],
+                      profile=globals_["profile"] or None)
+
+    context = {}
+    for args in stages:
+        with metrics.span(f"cli.{args.command}"):
+            args.func(args, context)
+
+
+if __name__ == "__main__":
+    main()
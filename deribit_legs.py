@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+# Cleaned leg schema (block_trade_data_clean.py) plus the exchange fields the Telegram path cannot see
+LEG_COLUMNS = [
+    "id", "block_trade_id", "date", "date_unixtime", "contract_size", "action", "contract_name", "iv",
+    "premium", "index_price", "underlying_price", "expiry", "strike", "type", "current_date",
+    "time_to_maturity", "risk_free_rate", "exchange_ms", "trade_seq", "price",
+]
+
+
+# Extracts expiry, strike and type from an instrument name such as BTC-27DEC24-100000-C.
+def parse_instrument_name(instrument_name):
+    parts = instrument_name.split("-")
+    if len(parts) != 4 or parts[3] not in ("C", "P"):
+        return None, None, None
+    try:
+        # Deribit options expire at 08:00 UTC
+        expiry = datetime.strptime(parts[1], "%d%b%y") + timedelta(hours=8)
+        strike = float(parts[2])
+    except ValueError:
+        return None, None, None
+    option_type = "Call" if parts[3] == "C" else "Put"
+    return expiry, strike, option_type
+
+
+# Decodes one Deribit trade object into the cleaned leg schema of block_trade_data_clean.py.
+def decode_trade(trade, received_ms=None):
+    """
+    Convert a trade from a Deribit trades.* notification into a leg record.
+
+    Parameters:
+        trade (dict): A single trade from the notification's "data" list.
+        received_ms (int): Local receive time in milliseconds, used for latency metrics.
+
+    Returns:
+        dict or None: The leg record, or None if the trade is not a BTC option.
+    """
+    instrument_name = trade.get("instrument_name", "")
+    if not instrument_name.startswith("BTC-"):
+        return None
+    expiry, strike, option_type = parse_instrument_name(instrument_name)
+    if expiry is None:
+        return None
+
+    timestamp_ms = int(trade["timestamp"])
+    current_date = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+    index_price = float(trade["index_price"])
+
+    return {
+        "id": trade.get("trade_id"),
+        "block_trade_id": trade.get("block_trade_id"),
+        "date": current_date.isoformat(),
+        "date_unixtime": timestamp_ms // 1000,
+        "contract_size": float(trade["amount"]),
+        "action": "Bought" if trade.get("direction") == "buy" else "Sold",
+        "contract_name": instrument_name,
+        "iv": float(trade["iv"]) if trade.get("iv") is not None else None,
+        # Option prices are quoted in BTC, the cleaned schema keeps USD premiums
+        "premium": float(trade["price"]) * index_price,
+        "index_price": index_price,
+        "underlying_price": float(trade.get("underlying_price", index_price)),
+        "expiry": expiry,
+        "strike": strike,
+        "type": option_type,
+        "current_date": current_date,
+        "time_to_maturity": (expiry - current_date).total_seconds() / SECONDS_PER_YEAR,
+        "risk_free_rate": 0.0,
+        "exchange_ms": timestamp_ms,
+        "trade_seq": trade.get("trade_seq"),
+        "price": float(trade["price"]),
+        # Set by serve_replay, so replayed latency is measured from the replay clock
+        "replay_sent_ms": trade.get("replay_sent_ms"),
+        "received_ms": received_ms if received_ms is not None else int(time.time() * 1000),
+    }
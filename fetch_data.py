@@ -1,5 +1,4 @@
 import asyncio
-import websockets
 import json
 
 
@@ -17,6 +16,9 @@ MSG_AUTH = \
 
 
 async def call_api(msg):
+    # Imported here so modules that only reuse the helpers below stay light to import
+    import websockets
+
     uri = 'wss://www.deribit.com/ws/api/v2'
     async with websockets.connect(uri) as websocket:
         await websocket.send(json.dumps(msg))
@@ -33,6 +35,90 @@ async def call_api(msg):
             return {"error": f"JSON decoding error: {e}"}
 
 
+class JsonRpcError(RuntimeError):
+    """
+    Error member of a JSON-RPC response, e.g. code 10028 (too_many_requests).
+    """
+
+    def __init__(self, method, error):
+        super().__init__(f"{method} failed: {error}")
+        self.code = error.get("code") if isinstance(error, dict) else None
+        self.error = error
+
+
+class JsonRpcClient:
+    """
+    One persistent websocket shared by many concurrent JSON-RPC calls.
+
+    Responses are matched to requests by id, so several calls can be in
+    flight at once instead of opening a connection per call like call_api.
+
+        async with JsonRpcClient() as client:
+            result = await client.call("public/get_time", {})
+    """
+
+    def __init__(self, uri='wss://www.deribit.com/ws/api/v2'):
+        self.uri = uri
+        self._websocket = None
+        self._reader = None
+        self._pending = {}
+        self._next_id = 1
+
+    async def __aenter__(self):
+        import websockets
+
+        self._websocket = await websockets.connect(self.uri, max_size=None)
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._reader.cancel()
+        await self._websocket.close()
+
+    # True once the connection has dropped or been closed; calls on it fail at once.
+    @property
+    def closed(self):
+        return self._reader is None or self._reader.done()
+
+    async def _read(self):
+        try:
+            async for raw in self._websocket:
+                message = json.loads(raw)
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except Exception as e:
+            error = e
+        else:
+            error = ConnectionError("Connection closed.")
+        # Wake every caller still waiting on this connection
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def call(self, method, params):
+        """
+        Send one request and wait for its response.
+
+        Returns:
+            The "result" member of the response.
+
+        Raises:
+            JsonRpcError: If the server answers with a JSON-RPC error.
+        """
+        request_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        await self._websocket.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method,
+                                               "params": params}))
+        response = await future
+        if "error" in response:
+            raise JsonRpcError(method, response["error"])
+        return response["result"]
+
+
 if __name__ == "__main__":
     asyncio.run(call_api(MSG_AUTH))
 
@@ -4,70 +4,61 @@ import asyncio
 import pandas as pd
 
 
+# Daily OHLC bars for an instrument between two dates (YYYY-MM-DD).
+def fetch_daily_prices(start_date, end_date, instrument_name="BTC-PERPETUAL", resolution="1D"):
+    start_ts = int(datetime.datetime.strptime(start_date, "%Y-%m-%d").timestamp()*1000)
+    end_ts = int(datetime.datetime.strptime(end_date, "%Y-%m-%d").timestamp()*1000)
 
-start_date = "2021-11-08"
-end_date = "2024-11-09"
-start_ts = int(datetime.datetime.strptime(start_date, "%Y-%m-%d").timestamp()*1000)
-end_ts =  int(datetime.datetime.strptime(end_date , "%Y-%m-%d").timestamp()*1000)
+    msg = \
+        {
+            "jsonrpc": "2.0",
+            "id": 833,
+            "method": "public/get_tradingview_chart_data",
+            "params": {
+                "instrument_name": instrument_name,
+                "start_timestamp": start_ts,
+                "end_timestamp": end_ts,
+                "resolution": resolution
+            }
+        }
+
+    json_data = asyncio.run(call_api(msg))['result']
+    price_df = pd.DataFrame(json_data)
+    price_df['date_time'] = pd.to_datetime(price_df['ticks'], unit='ms')
+    return price_df
 
 
-msg = \
+## get DVOL data
+def fetch_dvol_data(start_date, end_date, currency="BTC", resolution="1D"):
+    start_ts = int(datetime.datetime.strptime(start_date, "%Y-%m-%d").timestamp()*1000)
+    end_ts = int(datetime.datetime.strptime(end_date, "%Y-%m-%d").timestamp()*1000)
+
+    msg = \
     {
-        "jsonrpc": "2.0",
-        "id": 833,
-        "method": "public/get_tradingview_chart_data",
-        "params": {
-            "instrument_name": "BTC-PERPETUAL",
-            "start_timestamp": start_ts,
-            "end_timestamp": end_ts,
-            "resolution": "1D"
-        }
+      "jsonrpc" : "2.0",
+      "id" : 833,
+      "method" : "public/get_volatility_index_data",
+      "params" : {
+        "currency" : currency,
+        "start_timestamp" : start_ts,
+        "end_timestamp" : end_ts,
+        "resolution" : resolution
+      }
     }
 
-json_data = asyncio.run(call_api(msg))['result']
-price_df = pd.DataFrame(json_data)
-price_df['date_time'] = pd.to_datetime(price_df ['ticks'], unit='ms')
-price_df.to_csv("price_df_1d.csv", index=False)
+    json_data = asyncio.run(call_api(msg))['result']['data']
+    dvol_df = pd.DataFrame(json_data)
+    dvol_df.columns = ["ticks", "open", "high","low","close"]
+    dvol_df['date_time'] = pd.to_datetime(dvol_df['ticks'], unit='ms')
+    return dvol_df
 
 
-## get DVOL data
-# msg = \
-# {
-#   "jsonrpc" : "2.0",
-#   "id" : 833,
-#   "method" : "public/get_volatility_index_data",
-#   "params" : {
-#     "currency" : "BTC",
-#     "start_timestamp" : start_ts,
-#     "end_timestamp" : end_ts,
-#     "resolution" : "1D"
-#   }
-# }
-#
-# json_data = asyncio.run(call_api(msg))['result']['data']
-# dvol_df = pd.DataFrame(json_data)
-# dvol_df.columns = ["ticks", "open", "high","low","close"]
-# dvol_df['date_time'] = pd.to_datetime(dvol_df['ticks'], unit='ms')
-# dvol_df.to_csv("dvol_df.csv", index=False)
-#
-# msg2 = \
-# {
-#   "jsonrpc" : "2.0",
-#   "id" : 833,
-#   "method" : "public/get_volatility_index_data",
-#   "params" : {
-#     "currency" : "BTC",
-#     "start_timestamp" : start_ts,
-#     "end_timestamp" : 1644796800000,
-#     "resolution" : "1D"
-#   }
-# }
-#
-# json_data2 = asyncio.run(call_api(msg2))['result']['data']
-# dvol_df2 = pd.DataFrame(json_data2)
-# dvol_df2.columns = ["ticks", "open", "high","low","close"]
-# dvol_df2['date_time'] = pd.to_datetime(dvol_df2['ticks'], unit='ms')
-# dvol_df2.to_csv("dvol_df2.csv", index=False)
+if __name__ == "__main__":
+    start_date = "2021-11-08"
+    end_date = "2024-11-09"
+
+    price_df = fetch_daily_prices(start_date, end_date)
+    price_df.to_csv("price_df_1d.csv", index=False)
 
-## compute realized vols
-## get block trade data
\ No newline at end of file
+    # dvol_df = fetch_dvol_data(start_date, end_date)
+    # dvol_df.to_csv("dvol_df.csv", index=False)
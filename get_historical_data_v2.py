@@ -4,6 +4,8 @@ import pandas as pd
 from fetch_data import call_api
 import numpy as np
 
+import pipeline_metrics as metrics
+
 def fetch_btc_data(start_date: str, end_date: str, instrument_name: str = "BTC-PERPETUAL",
                    resolution: str = "5") -> pd.DataFrame:
     """
@@ -28,38 +30,42 @@ def fetch_btc_data(start_date: str, end_date: str, instrument_name: str = "BTC-P
 
     all_dataframes = []  # 用于存储每个时间段的DataFrame
 
-    # 根据每次请求的限制分段请求
-    current_start_ts = start_ts
-    while current_start_ts < end_ts:
-        current_end_ts = min(current_start_ts + interval_ms, end_ts)
-        msg = {
-            "jsonrpc": "2.0",
-            "id": 833,
-            "method": "public/get_tradingview_chart_data",
-            "params": {
-                "instrument_name": instrument_name,
-                "start_timestamp": current_start_ts,
-                "end_timestamp": current_end_ts,
-                "resolution": resolution
+    with metrics.span("fetch"):
+        # 根据每次请求的限制分段请求
+        current_start_ts = start_ts
+        while current_start_ts < end_ts:
+            current_end_ts = min(current_start_ts + interval_ms, end_ts)
+            msg = {
+                "jsonrpc": "2.0",
+                "id": 833,
+                "method": "public/get_tradingview_chart_data",
+                "params": {
+                    "instrument_name": instrument_name,
+                    "start_timestamp": current_start_ts,
+                    "end_timestamp": current_end_ts,
+                    "resolution": resolution
+                }
             }
-        }
 
-        try:
-            # 请求API数据
-            json_data = asyncio.run(call_api(msg))['result']
+            with metrics.span("fetch.window") as window_span:
+                try:
+                    # 请求API数据
+                    json_data = asyncio.run(call_api(msg))['result']
 
-            # 将数据转为DataFrame
-            price_df = pd.DataFrame(json_data)
+                    # 将数据转为DataFrame
+                    price_df = pd.DataFrame(json_data)
+                    window_span.add_rows(len(price_df))
 
-            if not price_df.empty:
-                # 添加日期时间字段
-                price_df['date_time'] = pd.to_datetime(price_df['ticks'], unit='ms')
-                all_dataframes.append(price_df)  # 将该段数据添加到总集中
-        except Exception as e:
-            print(f"Error fetching data from {current_start_ts} to {current_end_ts}: {e}")
+                    if not price_df.empty:
+                        # 添加日期时间字段
+                        price_df['date_time'] = pd.to_datetime(price_df['ticks'], unit='ms')
+                        all_dataframes.append(price_df)  # 将该段数据添加到总集中
+                except Exception as e:
+                    window_span.fail(f"error:{type(e).__name__}")
+                    print(f"Error fetching data from {current_start_ts} to {current_end_ts}: {e}")
 
-        # 进入下一段请求
-        current_start_ts = current_end_ts
+            # 进入下一段请求
+            current_start_ts = current_end_ts
 
     if all_dataframes:
         # \5408并所有数据为一个DataFrame
@@ -83,22 +89,23 @@ def calculate_realized_volatility(price_df: pd.DataFrame) -> pd.DataFrame:
     if 'close' not in price_df.columns:
         raise ValueError("DataFrame 必须包含 'close' 列")
 
-    # 确保 'date_time' 列是 datetime 格式
-    price_df['date_time'] = pd.to_datetime(price_df['date_time'],
-                                           errors='coerce')  # 将 date_time 转换为datetime格式，并将无效数据转换为NaT
-    if price_df['date_time'].isnull().any():
-        raise ValueError("`date_time` 列中包含无效的时间格式，请检查数据是否包含NaT或无效的时间戳。")
+    with metrics.span("rv", rows=len(price_df)):
+        # 确保 'date_time' 列是 datetime 格式
+        price_df['date_time'] = pd.to_datetime(price_df['date_time'],
+                                               errors='coerce')  # 将 date_time 转换为datetime格式，并将无效数据转换为NaT
+        if price_df['date_time'].isnull().any():
+            raise ValueError("`date_time` 列中包含无效的时间格式，请检查数据是否包含NaT或无效的时间戳。")
 
-    # 提取日期并计算对数收益率
-    price_df['date'] = price_df['date_time'].dt.date  # 提取日期部分
-    price_df['log_return'] = np.log(price_df['close'] / price_df['close'].shift(1))  # 计算对数收益率
+        # 提取日期并计算对数收益率
+        price_df['date'] = price_df['date_time'].dt.date  # 提取日期部分
+        price_df['log_return'] = np.log(price_df['close'] / price_df['close'].shift(1))  # 计算对数收益率
 
-    # 计算每日的已实现波动率
-    daily_volatility = price_df.groupby('date')['log_return'].apply(lambda x: np.sqrt(np.sum(x ** 2)))
+        # 计算每日的已实现波动率
+        daily_volatility = price_df.groupby('date')['log_return'].apply(lambda x: np.sqrt(np.sum(x ** 2)))
 
-    # 重置索引并重命名列
-    volatility_df = daily_volatility.reset_index()
-    volatility_df.columns = ['date', 'realized_volatility']
+        # 重置索引并重命名列
+        volatility_df = daily_volatility.reset_index()
+        volatility_df.columns = ['date', 'realized_volatility']
 
     return volatility_df
 
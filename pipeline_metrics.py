@@ -0,0 +1,264 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+
+_config = {
+    "jsonl_path": os.environ.get("PIPELINE_METRICS_JSONL"),
+    "prometheus_path": os.environ.get("PIPELINE_METRICS_PROM"),
+    "profile": os.environ.get("PIPELINE_PROFILE", "") not in ("", "0"),
+    "profile_interval": 0.005,
+    "pid": os.getpid(),
+}
+_local = threading.local()
+_lock = threading.Lock()
+_pending = []   # finished span records not yet written to the JSONL sink
+_totals = {}    # span name -> running totals for the Prometheus sink
+
+
+# Sets where metrics go; the same options can be given through PIPELINE_METRICS_* / PIPELINE_PROFILE.
+def configure(jsonl_path=None, prometheus_path=None, profile=None, profile_interval=None):
+    """
+    Parameters:
+        jsonl_path (str): Append one JSON record per finished span to this file.
+        prometheus_path (str): Rewrite this file with Prometheus text-format totals on export.
+        profile (bool): Sample the stack of every top-level span and attach the hottest frames.
+        profile_interval (float): Seconds between stack samples.
+    """
+    if jsonl_path is not None:
+        _config["jsonl_path"] = jsonl_path
+    if prometheus_path is not None:
+        _config["prometheus_path"] = prometheus_path
+    if profile is not None:
+        _config["profile"] = profile
+    if profile_interval is not None:
+        _config["profile_interval"] = profile_interval
+    # Only the configuring process exports; forked pool workers ship their spans back instead
+    _config["pid"] = os.getpid()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class StackSampler(threading.Thread):
+    """
+    Minimal sampling profiler: periodically records the innermost frames of one thread.
+    """
+
+    def __init__(self, thread_id, interval=0.005, depth=4):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # Innermost few frames, so time inside numpy/scipy is attributed to the calling code
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[" <- ".join(stack)] += 1
+
+    def stop(self, top=15):
+        self._stop_event.set()
+        self.join()
+        total = sum(self.samples.values())
+        return [{"stack": stack, "samples": count, "share": count / total}
+                for stack, count in self.samples.most_common(top)]
+
+
+class Span:
+    """
+    Wall/CPU time, row count, failures by reason and peak RSS of one pipeline stage.
+    """
+
+    def __init__(self, name, parent=None, rows=None):
+        self.name = name
+        self.parent = parent
+        self.rows = rows
+        self.failures = Counter()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._sampler = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def add_rows(self, n):
+        self.rows = (self.rows or 0) + n
+
+    def fail(self, reason, n=1):
+        self.failures[reason] += n
+
+    def finish(self):
+        wall = time.perf_counter() - self._wall_start
+        record = {
+            "span": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "wall_s": wall,
+            "cpu_s": time.process_time() - self._cpu_start,
+            "rows": self.rows,
+            "rows_per_s": self.rows / wall if self.rows and wall > 0 else None,
+            "failures": dict(self.failures),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        if self._sampler is not None:
+            record["profile"] = self._sampler.stop()
+        return record
+
+
+def _stack():
+    # A forked pool worker starts with a copy of the parent's open spans; begin afresh
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.stack = []
+        _local.pid = os.getpid()
+    return _local.stack
+
+
+def current_span():
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+# Counts a failed row against the innermost open span; a no-op outside any span.
+def record_failure(reason, n=1):
+    active = current_span()
+    if active is not None:
+        active.fail(reason, n)
+
+
+def _add_to_totals(record):
+    totals = _totals.setdefault(record["span"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": 0,
+                                                 "failures": Counter(), "peak_rss_mb": 0.0})
+    totals["count"] += 1
+    totals["wall_s"] += record["wall_s"]
+    totals["cpu_s"] += record["cpu_s"]
+    totals["rows"] += record["rows"] or 0
+    totals["failures"].update(record["failures"])
+    if record["peak_rss_mb"] is not None:
+        totals["peak_rss_mb"] = max(totals["peak_rss_mb"], record["peak_rss_mb"])
+
+
+@contextmanager
+def span(name, rows=None, worker=False):
+    """
+    Time a block of pipeline work.
+
+        with span("greeks", rows=len(df)) as s:
+            ...
+            s.fail("non_finite")
+
+    Pool tasks open their span with worker=True and return drain() with their
+    results. Their records are then never exported from the worker, whatever
+    the start method (fork, spawn or forkserver).
+    """
+    stack = _stack()
+    current = Span(name, parent=stack[-1] if stack else None, rows=rows)
+    if _config["profile"] and not stack:
+        current._sampler = StackSampler(threading.get_ident(), _config["profile_interval"])
+        current._sampler.start()
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        stack.pop()
+        record = current.finish()
+        with _lock:
+            _pending.append(record)
+            _add_to_totals(record)
+        if not stack and not worker and os.getpid() == _config["pid"]:
+            export()
+
+
+# Returns and clears the span records of this process; pool workers send these back with their results.
+def drain():
+    # Called in-process (e.g. a single-worker fallback) the records already belong to the open span
+    if current_span() is not None:
+        return []
+    pid = os.getpid()
+    with _lock:
+        # Forked workers inherit the parent's pending records; only ship our own
+        records = [record for record in _pending if record["pid"] == pid]
+        _pending.clear()
+        _totals.clear()
+    return records
+
+
+# Merges span records shipped back from pool workers, rolling their failures up into the open span.
+def collect(records):
+    active = current_span()
+    with _lock:
+        for record in records:
+            if record["parent"] is None and active is not None:
+                record["parent"] = active.name
+            _pending.append(record)
+            _add_to_totals(record)
+    if active is not None:
+        for record in records:
+            active.failures.update(record["failures"])
+
+
+def _prometheus_text():
+    lines = []
+    metrics = [
+        ("pipeline_span_count_total", "counter", "Finished spans.", "count"),
+        ("pipeline_span_wall_seconds_total", "counter", "Wall-clock seconds spent in spans.", "wall_s"),
+        ("pipeline_span_cpu_seconds_total", "counter", "CPU seconds spent in spans.", "cpu_s"),
+        ("pipeline_span_rows_total", "counter", "Rows processed in spans.", "rows"),
+        ("pipeline_span_peak_rss_megabytes", "gauge", "Peak resident memory seen at span end.", "peak_rss_mb"),
+    ]
+    for metric, kind, help_text, key in metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for name, totals in sorted(_totals.items()):
+            lines.append(f'{metric}{{span="{name}"}} {totals[key]}')
+    lines += ["# HELP pipeline_span_failures_total Failed rows by reason.",
+              "# TYPE pipeline_span_failures_total counter"]
+    for name, totals in sorted(_totals.items()):
+        for reason, count in sorted(totals["failures"].items()):
+            lines.append(f'pipeline_span_failures_total{{span="{name}",reason="{reason}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+# Flushes pending span records to the JSONL sink and rewrites the Prometheus text file.
+def export():
+    with _lock:
+        records = list(_pending)
+        _pending.clear()
+        prometheus_text = _prometheus_text() if _config["prometheus_path"] else None
+
+    if _config["jsonl_path"] and records:
+        with open(_config["jsonl_path"], "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    if prometheus_text is not None:
+        tmp_path = f"{_config['prometheus_path']}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text)
+        os.replace(tmp_path, _config["prometheus_path"])
+
+
+# Per-span totals for this process, e.g. to print at the end of a run.
+def summary():
+    with _lock:
+        return {name: dict(totals, failures=dict(totals["failures"])) for name, totals in _totals.items()}
@@ -0,0 +1,402 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import pipeline_metrics as metrics
+
+
+PARTITION_PATTERNS = ("*.parquet", "*.pkl", "*.csv")
+
+
+class MomentAccumulator:
+    """
+    Count, mean, central moments and extrema of a stream of values.
+
+    Partial results from separate chunks or processes are combined with
+    `merge` using the pairwise update of Chan et al. / Pebay.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+        batch = MomentAccumulator()
+        batch.n = values.size
+        batch.mean = values.mean()
+        dev = values - batch.mean
+        dev2 = dev * dev
+        batch.m2 = dev2.sum()
+        batch.m3 = (dev2 * dev).sum()
+        batch.m4 = (dev2 * dev2).sum()
+        batch.min = values.min()
+        batch.max = values.max()
+        return self.merge(batch)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        na, nb = self.n, other.n
+        n = na + nb
+        d = other.mean - self.mean
+        d2 = d * d
+        m2 = self.m2 + other.m2 + d2 * na * nb / n
+        m3 = (self.m3 + other.m3 + d * d2 * na * nb * (na - nb) / n ** 2
+              + 3 * d * (na * other.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + other.m4 + d2 * d2 * na * nb * (na * na - na * nb + nb * nb) / n ** 3
+              + 6 * d2 * (na * na * other.m2 + nb * nb * self.m2) / n ** 2
+              + 4 * d * (na * other.m3 - nb * self.m3) / n)
+        self.n = n
+        self.mean += d * nb / n
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def std(self):
+        # Sample standard deviation, matching pandas' ddof=1
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+    def skew(self):
+        # Adjusted Fisher-Pearson coefficient, as in pandas.Series.skew
+        n = self.n
+        if n < 3 or self.m2 == 0:
+            return np.nan
+        g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+        return np.sqrt(n * (n - 1)) / (n - 2) * g1
+
+    def kurtosis(self):
+        # Bias-corrected excess kurtosis, as in pandas.Series.kurtosis
+        n = self.n
+        if n < 4 or self.m2 == 0:
+            return np.nan
+        numerator = n * (n + 1) * (n - 1) * self.m4
+        denominator = (n - 2) * (n - 3) * self.m2 ** 2
+        return numerator / denominator - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Retains O(k) values no matter how many are added; with the default
+    k=200 the rank error of a quantile is typically below 1%.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Keep one item back when the count is odd so total weight is preserved
+                keep = items[:len(items) % 2]
+                promoted = items[len(keep) + self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # Capacities depend on the number of levels, so rescan from the bottom
+                level = 0
+                continue
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+        self.n += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="mergesort")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        idx = np.searchsorted(cumulative, qs * cumulative[-1], side="left")
+        return values[np.clip(idx, 0, len(values) - 1)]
+
+
+class ColumnSummary:
+    """
+    Moments plus a quantile sketch for one column; mergeable across partitions.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.moments = MomentAccumulator()
+        self.sketch = KLLSketch(k, seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        self.moments.update(values)
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def as_dict(self):
+        q25, q50, q75 = self.sketch.quantiles([0.25, 0.5, 0.75])
+        m = self.moments
+        return {
+            "count": m.n,
+            "mean": m.mean if m.n else np.nan,
+            "median": q50,
+            "std": m.std(),
+            "min": m.min if m.n else np.nan,
+            "25%": q25,
+            "50%": q50,
+            "75%": q75,
+            "max": m.max if m.n else np.nan,
+            "skew": m.skew(),
+            "kurtosis": m.kurtosis(),
+        }
+
+
+# Finds the partition files (parquet, pickle or csv) under a directory.
+def list_partitions(directory):
+    paths = []
+    for pattern in PARTITION_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    return sorted(paths)
+
+
+# Yields the requested columns of a partition in bounded-size chunks.
+def iter_partition_chunks(partition, columns, chunksize=1_000_000):
+    """
+    Parameters:
+        partition (str or pd.DataFrame): A parquet/pickle/csv path or an in-memory frame.
+        columns (list): Columns to read.
+        chunksize (int): Maximum rows per yielded chunk.
+
+    Raises:
+        ValueError: If any of the columns is not in the partition, checked before reading rows.
+    """
+    if isinstance(partition, pd.DataFrame):
+        df = partition
+        available = df.columns
+    elif partition.endswith(".csv"):
+        available = pd.read_csv(partition, nrows=0).columns
+    elif partition.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        available = pq.read_schema(partition).names
+    else:
+        df = pd.read_pickle(partition)
+        available = df.columns
+    missing_cols = [col for col in columns if col not in available]
+    if missing_cols:
+        label = partition if isinstance(partition, str) else "in-memory frame"
+        raise ValueError(f"The following columns are not in the partition {label}: {missing_cols}")
+
+    if isinstance(partition, str) and partition.endswith(".csv"):
+        # CSV is the only format that can be streamed without loading the whole file
+        for chunk in pd.read_csv(partition, usecols=columns, chunksize=chunksize):
+            yield chunk
+        return
+    if isinstance(partition, str) and partition.endswith(".parquet"):
+        df = pd.read_parquet(partition, columns=columns)
+    else:
+        df = df[columns]
+
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+# Builds partial column summaries for one partition; runs inside a worker process.
+def summarize_partition(args):
+    partition, columns, k, seed = args
+    summaries = {col: ColumnSummary(k, seed) for col in columns}
+    with metrics.span("summary.partition", worker=True) as partition_span:
+        for chunk in iter_partition_chunks(partition, columns):
+            partition_span.add_rows(len(chunk))
+            for col in columns:
+                values = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=float)
+                non_finite = int((~np.isfinite(values)).sum())
+                if non_finite:
+                    partition_span.fail(f"non_finite:{col}", non_finite)
+                summaries[col].update(values)
+    return summaries, metrics.drain()
+
+
+# Streaming replacement for summarize_statistics in summary_stat.ipynb.
+def summarize_statistics(partitions, columns, k=200, max_workers=None, seed=0):
+    """
+    Calculate descriptive statistics over partitioned data in one streaming pass.
+
+    Each partition is summarised in its own worker process and the partial
+    moments and quantile sketches are merged, so memory is bounded by the
+    largest partition rather than the whole dataset.
+
+    Parameters:
+        partitions (list or str): Partition paths/DataFrames, or a directory of partitions.
+        columns (list): Column names to summarise.
+        k (int): KLL sketch size; larger values give more accurate quantiles.
+        max_workers (int): Worker processes, defaults to the number of cores.
+        seed (int): Seed of the sketches' compaction coin flips. Each partition gets
+            [seed, partition index], so the same data and seed give the same quartiles.
+
+    Returns:
+        pd.DataFrame: One row per column with mean, median, std, min, quartiles, max, skew and kurtosis.
+    """
+    if isinstance(partitions, str):
+        partitions = list_partitions(partitions)
+    totals = {col: ColumnSummary(k, [seed, len(partitions)]) for col in columns}
+
+    tasks = [(partition, columns, k, [seed, i]) for i, partition in enumerate(partitions)]
+    with metrics.span("summary"):
+        if max_workers == 1 or len(tasks) <= 1:
+            for partial, _ in map(summarize_partition, tasks):
+                for col in columns:
+                    totals[col].merge(partial[col])
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for partial, partition_spans in executor.map(summarize_partition, tasks):
+                    metrics.collect(partition_spans)
+                    for col in columns:
+                        totals[col].merge(partial[col])
+
+    summary_df = pd.DataFrame([totals[col].as_dict() for col in columns], index=columns)
+    summary_df.index.name = "Variable"
+    return summary_df
+
+
+# Linear binning of values onto a regular grid; counts from different partitions can be summed.
+def bin_values(values, lo, hi, grid_size=1024):
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    counts = np.zeros(grid_size)
+    if values.size == 0 or hi <= lo:
+        return counts
+    pos = np.clip((values - lo) / (hi - lo) * (grid_size - 1), 0, grid_size - 1)
+    left = np.minimum(np.floor(pos).astype(int), grid_size - 2)
+    frac = pos - left
+    counts += np.bincount(left, weights=1 - frac, minlength=grid_size)
+    counts += np.bincount(left + 1, weights=frac, minlength=grid_size)
+    return counts
+
+
+# Gaussian KDE evaluated on the grid by FFT convolution of the binned counts.
+def kde_from_counts(counts, lo, hi, bandwidth):
+    """
+    Parameters:
+        counts (np.ndarray): Output of bin_values, possibly summed over partitions.
+        lo, hi (float): Grid range used for binning.
+        bandwidth (float): Kernel standard deviation in data units.
+
+    Returns:
+        tuple: (grid, density) arrays of length len(counts).
+    """
+    grid_size = len(counts)
+    grid = np.linspace(lo, hi, grid_size)
+    n = counts.sum()
+    if n == 0 or hi <= lo or not bandwidth > 0:
+        return grid, np.zeros(grid_size)
+
+    dx = grid[1] - grid[0]
+    half_width = min(grid_size - 1, int(np.ceil(4 * bandwidth / dx)))
+    offsets = np.arange(-half_width, half_width + 1) * dx
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+    # Zero-pad to avoid circular wrap-around
+    size = 1 << int(np.ceil(np.log2(grid_size + len(kernel) - 1)))
+    conv = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)
+    density = conv[half_width:half_width + grid_size] / n
+    return grid, np.maximum(density, 0.0)
+
+
+# Replacement for scipy.stats.gaussian_kde(values)(np.linspace(min, max, m)): O(n + m log m).
+def binned_kde(values, grid_size=1024, bandwidth=None, lo=None, hi=None):
+    """
+    Binned Gaussian KDE using Scott's rule by default, like scipy's gaussian_kde.
+
+    Returns:
+        tuple: (grid, density) arrays.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    lo = values.min() if lo is None else lo
+    hi = values.max() if hi is None else hi
+    if bandwidth is None:
+        bandwidth = values.std(ddof=1) * values.size ** (-1 / 5)
+    return kde_from_counts(bin_values(values, lo, hi, grid_size), lo, hi, bandwidth)
+
+
+def _bin_partition(args):
+    partition, column, lo, hi, grid_size = args
+    counts = np.zeros(grid_size)
+    for chunk in iter_partition_chunks(partition, [column]):
+        counts += bin_values(pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=float),
+                             lo, hi, grid_size)
+    return counts
+
+
+# Binned KDE over partitioned data, using a summary from summarize_statistics for range and bandwidth.
+def partitioned_kde(partitions, column, summary=None, grid_size=1024, max_workers=None):
+    if isinstance(partitions, str):
+        partitions = list_partitions(partitions)
+    if summary is None:
+        summary = summarize_statistics(partitions, [column], max_workers=max_workers)
+    row = summary.loc[column]
+    lo, hi = row["min"], row["max"]
+    bandwidth = row["std"] * row["count"] ** (-1 / 5)
+
+    tasks = [(partition, column, lo, hi, grid_size) for partition in partitions]
+    counts = np.zeros(grid_size)
+    if max_workers == 1 or len(tasks) <= 1:
+        for partial in map(_bin_partition, tasks):
+            counts += partial
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for partial in executor.map(_bin_partition, tasks):
+                counts += partial
+    return kde_from_counts(counts, lo, hi, bandwidth)
+
+
+if __name__ == "__main__":
+    data_path = os.path.join("data", "block_trade_with_greeks.pkl")
+    columns_to_summarize = ["contract_size", "premium", "time_to_maturity", "Delta", "Gamma", "Vega"]
+    summary = summarize_statistics([data_path], columns_to_summarize)
+    print(summary.T)
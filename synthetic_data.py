@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from black76_model import iv_to_sigma
+from var_model import VAR_COLUMNS
+
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+START_DATE = "2021-11-08"
+SAMPLE_DAYS = 1096  # Nov 2021 to Nov 2024, the research sample
+
+
+# Next Friday 08:00 UTC at least `days` ahead: Deribit's weekly/monthly/quarterly expiry slot.
+def _friday_expiries(current_dates, days):
+    target = current_dates + pd.to_timedelta(days, unit="D")
+    shift = (4 - target.dt.weekday) % 7
+    return target.dt.normalize() + pd.to_timedelta(shift, unit="D") + pd.Timedelta(hours=8)
+
+
+# Deribit instrument names such as BTC-27DEC24-100000-C.
+def _contract_names(expiry, strike, is_call):
+    day = expiry.dt.day.astype(str)
+    month_year = expiry.dt.strftime("%b%y").str.upper()
+    strike_str = strike.astype(np.int64).astype(str)
+    suffix = np.where(is_call, "C", "P")
+    return "BTC-" + day + month_year + "-" + strike_str + "-" + suffix
+
+
+# Seeded block-leg frame in the schema written by block_trade_data_clean.py.
+def generate_block_legs(n, seed=0, start_date=START_DATE, days=SAMPLE_DAYS):
+    """
+    Generate n option legs with realistic strike, expiry and IV distributions.
+
+    Index prices follow a daily random walk around the 2021-2024 range, tenors
+    are skewed towards short-dated expiries, strikes cluster around the money
+    on the Deribit strike grid and IVs follow a simple smile. IVs are in percent,
+    as block_trade_data_clean.py emits them, and premiums are the Black-76
+    prices at iv_to_sigma(iv), the conversion the pricing stages apply.
+
+    Returns:
+        pd.DataFrame: Columns id, date, date_unixtime, contract_size, action,
+        contract_name, iv, premium, index_price, expiry, strike, type,
+        current_date, time_to_maturity, risk_free_rate.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Daily index path around the 2021-2024 cycle (65K -> 17K -> 37K -> 75K), then intraday trade times
+    anchors = np.interp(np.arange(days), [0, 365, 730, 1095], np.log([65000, 17000, 37000, 75000]))
+    noise = np.cumsum(rng.normal(0, 0.03, days))
+    daily_index = np.exp(anchors + noise - np.linspace(0, 1, days) * noise[-1])
+    day = rng.integers(0, days, n)
+    seconds = rng.integers(0, 24 * 60 * 60, n)
+    # Anchored to UTC so a seed produces the same data on every machine
+    start_ts = int(pd.Timestamp(start_date, tz="UTC").timestamp())
+    date_unixtime = start_ts + day * 86400 + seconds
+    current_date = pd.Series(pd.to_datetime(date_unixtime, unit="s"))
+    index_price = np.round(daily_index[day] * np.exp(rng.normal(0, 0.01, n)), 2)
+
+    # Tenor in days: mostly weeklies/monthlies with a long tail to quarterlies
+    tenor_days = np.clip(rng.exponential(30, n), 1, 365)
+    expiry = _friday_expiries(current_date, tenor_days)
+    time_to_maturity = (expiry - current_date).dt.total_seconds().to_numpy() / SECONDS_PER_YEAR
+
+    # Strikes: log-moneyness scaled by tenor, snapped to the 1000 USD grid
+    moneyness = rng.normal(0, 0.12, n) * np.sqrt(np.maximum(time_to_maturity, 1 / 365) * 4)
+    strike = np.maximum(np.round(index_price * np.exp(moneyness) / 1000) * 1000, 1000.0)
+    is_call = rng.random(n) < 0.55
+
+    # IV smile in percent, rounded to the 0.1% Laevitas quotes
+    log_k = np.log(strike / index_price)
+    iv = np.round(np.clip(55 + 60 * log_k ** 2 - 8 * log_k + rng.normal(0, 4, n), 20, 200), 1)
+
+    F = index_price
+    sigma = iv_to_sigma(iv)
+    d1 = (np.log(F / strike) + 0.5 * sigma ** 2 * time_to_maturity) / (sigma * np.sqrt(time_to_maturity))
+    d2 = d1 - sigma * np.sqrt(time_to_maturity)
+    premium = np.where(is_call, F * norm.cdf(d1) - strike * norm.cdf(d2),
+                       strike * norm.cdf(-d2) - F * norm.cdf(-d1))
+
+    contract_size = np.round(np.clip(rng.lognormal(np.log(25), 1.0, n), 1, 5000), 1)
+
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "date": current_date.dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        "date_unixtime": date_unixtime.astype(str),
+        "contract_size": contract_size,
+        "action": np.where(rng.random(n) < 0.5, "Bought", "Sold"),
+        "contract_name": _contract_names(expiry, strike, is_call),
+        "iv": iv,
+        "premium": np.round(np.maximum(premium, 1.0), 2),
+        "index_price": index_price,
+        "expiry": expiry,
+        "strike": strike,
+        "type": np.where(is_call, "Call", "Put"),
+        "current_date": current_date,
+        "time_to_maturity": time_to_maturity,
+        "risk_free_rate": 0.0,
+    })
+
+
+# Formats USD premiums the way Laevitas does: $850, $3.05K, $1.2M.
+def _format_premiums(values):
+    values = np.asarray(values, dtype=float)
+    millions = np.char.add(np.char.mod("%.2f", values / 1e6), "M")
+    thousands = np.char.add(np.char.mod("%.2f", values / 1e3), "K")
+    units = np.char.mod("%.0f", values)
+    return np.where(values >= 1e6, millions, np.where(values >= 1e3, thousands, units))
+
+
+# Seeded Telegram export records in the Laevitas block-trade message format.
+def generate_telegram_messages(n_legs, seed=0, noise_fraction=0.1):
+    """
+    Generate Telegram export records ({"id", "date", "date_unixtime", "text"})
+    containing about n_legs BTC option legs, as parsed by block_trade_data_clean.py.
+
+    A `noise_fraction` of extra messages are futures blocks, ETH blocks or
+    rich-text records, so the parser's skip paths are exercised too.
+    """
+    rng = np.random.default_rng(seed)
+    legs = generate_block_legs(n_legs, seed=seed)
+    legs = legs.sort_values("date_unixtime", kind="mergesort").reset_index(drop=True)
+
+    premium = legs["premium"].to_numpy()
+    index_price = legs["index_price"].to_numpy()
+    leg_lines = (legs["action"] + " " + legs["contract_name"] + " at "
+                 + np.char.mod("%.4f", premium / index_price) + " ($" + _format_premiums(premium)
+                 + ") IV: " + legs["iv"].astype(str) + "%").tolist()
+    headers = ("\U0001F7E2 BTC BLOCK TRADE (x" + legs["contract_size"].astype(str) + ")").tolist()
+    footers = ("Index Price $" + legs["index_price"].astype(str)).tolist()
+    actions = legs["action"].tolist()
+    dates = legs["date"].tolist()
+    unixtimes = legs["date_unixtime"].tolist()
+
+    # Legs per message, mostly single legs with some 2-4 leg structures
+    sizes = rng.choice([1, 1, 1, 2, 2, 3, 4], size=n_legs)
+    noise = rng.random(n_legs) < noise_fraction
+    noise_kind = rng.integers(3, size=n_legs)
+    noise_texts = [
+        "BTC FUTURES BLOCK (x100.0)\nBought BTC-PERPETUAL at 60000",
+        "ETH BLOCK TRADE (x100.0)\nSold ETH-27DEC24-4000-C at 0.05 ($200) IV: 60%",
+        [{"type": "bold", "text": "Daily summary"}, "\n"],
+    ]
+
+    records = []
+    i = 0
+    m = 0
+    while i < n_legs:
+        j = min(i + int(sizes[m]), n_legs)
+        bought = actions[i:j].count("Bought")
+        total_action = "Bought" if bought * 2 >= j - i else "Sold"
+        total = _format_premiums([premium[i:j].sum()])[0]
+        text = "\n".join([headers[i], ""] + leg_lines[i:j]
+                         + ["", f"Total {total_action}: ${total}", footers[i]])
+        records.append({"id": len(records) + 1, "date": dates[i], "date_unixtime": unixtimes[i], "text": text})
+        if noise[m]:
+            records.append({"id": len(records) + 1, "date": dates[i], "date_unixtime": unixtimes[i],
+                            "text": noise_texts[noise_kind[m]]})
+        i = j
+        m += 1
+
+    # Telegram exports list messages oldest first; the parser walks them in reverse
+    return records
+
+
+# Seeded one-minute OHLCV bars in the format of data/price_df_1min.csv.
+def generate_ohlcv_bars(n, seed=0, start_date=START_DATE, start_price=60000.0, annual_vol=0.6):
+    rng = np.random.default_rng(seed)
+    minute_vol = annual_vol / np.sqrt(365 * 24 * 60)
+    log_returns = rng.standard_t(4, n) * minute_vol / np.sqrt(2)
+    close = start_price * np.exp(np.cumsum(log_returns))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    wiggle = np.abs(rng.normal(0, minute_vol, (2, n))) * close
+    high = np.maximum(open_, close) + wiggle[0]
+    low = np.minimum(open_, close) - wiggle[1]
+    volume = rng.lognormal(2.5, 1.0, n)
+
+    ticks = int(pd.Timestamp(start_date, tz="UTC").timestamp() * 1000) + np.arange(n) * 60_000
+    return pd.DataFrame({
+        "close": np.round(close, 1),
+        "high": np.round(high, 1),
+        "low": np.round(low, 1),
+        "open": np.round(open_, 1),
+        "status": "ok",
+        "cost": np.round(volume * close, 1),
+        "volume": volume,
+        "ticks": ticks,
+        "date_time": pd.to_datetime(ticks, unit="ms"),
+    })
+
+
+# Seeded daily series for the VAR in BtcVARModel.R, drawn from a stable VAR(1).
+def generate_var_frame(n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    k = len(VAR_COLUMNS)
+    A = np.diag(rng.uniform(0.1, 0.5, k)) + rng.normal(0, 0.03, (k, k))
+    scale = np.array([0.03, 3.0, 0.01, 500.0, 0.05, 20000.0])
+    values = np.zeros((n_days, k))
+    for t in range(1, n_days):
+        values[t] = values[t - 1] @ A.T + rng.normal(0, 1, k)
+    dates = pd.date_range(START_DATE, periods=n_days, freq="D")
+    return pd.DataFrame(values * scale, columns=VAR_COLUMNS, index=dates)
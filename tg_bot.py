@@ -1,6 +1,4 @@
 import asyncio
-import psycopg2
-from telethon import TelegramClient
 
 # 替换为你的 API ID 和 API Hash
 api_id = '11111'
@@ -19,6 +17,8 @@ db_params = {
 
 # 创建 PostgreSQL 数据库连接
 def connect_postgresql():
+    import psycopg2
+
     try:
         conn = psycopg2.connect(**db_params)
         print("PostgreSQL connected successfully.")
@@ -61,13 +61,12 @@ def insert_message(conn, message_id, message_text, message_date):
         conn.rollback()
 
 # Telegram 主函数
-async def fetch_telegram_messages(conn):
+async def fetch_telegram_messages(conn, target_group='@laevitas'):
+    from telethon import TelegramClient
+
     # 创建 Telegram 客户端
     client = TelegramClient('session_name', api_id, api_hash)
-    await client.start(phone=phone_number)
-
-    # 替换为目标群组的用户名或 ID
-    target_group = '@laevitas'
+    await client.start(phone=phone)
 
     # 获取群组实体
     group = await client.get_entity(target_group)
@@ -79,22 +78,25 @@ async def fetch_telegram_messages(conn):
 
     print("All messages fetched and stored.")
 
-# 主入口
-if __name__ == '__main__':
+# 抓取群组消息并写入 PostgreSQL
+def scrape_messages(target_group='@laevitas'):
     # 连接 PostgreSQL
     postgres_conn = connect_postgresql()
     if postgres_conn is None:
-        exit("Failed to connect to PostgreSQL, exiting.")
+        raise RuntimeError("Failed to connect to PostgreSQL, exiting.")
 
     # 确保表存在
     create_table(postgres_conn)
 
     # 运行 Telegram 客户端获取消息
     try:
-        with TelegramClient('session_name', api_id, api_hash) as client:
-            asyncio.run(fetch_telegram_messages(postgres_conn))
+        asyncio.run(fetch_telegram_messages(postgres_conn, target_group))
     finally:
         # 关闭 PostgreSQL 连接
-        if postgres_conn:
-            postgres_conn.close()
-            print("PostgreSQL connection closed.")
\ No newline at end of file
+        postgres_conn.close()
+        print("PostgreSQL connection closed.")
+
+
+# 主入口
+if __name__ == '__main__':
+    scrape_messages()
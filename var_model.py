@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+import pipeline_metrics as metrics
+
+
+VAR_COLUMNS = ["log_return", "iv_diff", "VRP", "Delta", "Gamma", "Vega"]
+
+
+# Sums leg-level Greeks into the daily series used by BtcVARModel.R (aggregated_greeeks.csv).
+def aggregate_daily_greeks(df, columns=("Delta", "Gamma", "Vega", "Theta")):
+    """
+    Parameters:
+        df (pd.DataFrame): Legs with 'current_date' and Greek columns, e.g. block_trade_with_greeks.pkl.
+        columns (tuple): Greek columns to sum; columns missing from df are skipped.
+
+    Returns:
+        pd.DataFrame: One row per day with a 'date_only' column and the summed Greeks.
+    """
+    with metrics.span("aggregate", rows=len(df)):
+        columns = [col for col in columns if col in df.columns]
+        dates = pd.to_datetime(df["current_date"]).dt.date
+        aggregated = df[columns].apply(pd.to_numeric, errors="coerce").groupby(dates).sum()
+        aggregated.index.name = "date_only"
+        return aggregated.reset_index()
+
+
+def _date_key(series):
+    # Dates come as "2021-11-09", "2021/11/9" or full timestamps depending on the source file
+    return pd.to_datetime(series.astype(str).str.replace("/", "-", regex=False)).dt.strftime("%Y-%m-%d")
+
+
+# Steps 1-8 of BtcVARModel.R: joins returns, DVOL changes, VRP and daily Greeks into the VAR input.
+def build_var_frame(daily_price_df, volatility_df, dvol_df, aggregated_greeks):
+    """
+    Parameters:
+        daily_price_df (pd.DataFrame): Daily OHLC with 'date_time' and 'open' (daily_price_ohlc.csv).
+        volatility_df (pd.DataFrame): 'date' and 'realized_volatility' (daily_realized_volatility.csv).
+        dvol_df (pd.DataFrame): 'date_time' and 'close' of the DVOL index (dvol_df.csv).
+        aggregated_greeks (pd.DataFrame): Output of aggregate_daily_greeks.
+
+    Returns:
+        pd.DataFrame: VAR_COLUMNS indexed by date, rows with missing values dropped.
+    """
+    # The next day's open is used as the close, as in the R script
+    close_df = pd.DataFrame({"date_time": _date_key(daily_price_df["date_time"]),
+                             "close": daily_price_df["open"].shift(-1)}).dropna()
+    close_df["log_return"] = np.log(close_df["close"] / close_df["close"].shift(1))
+
+    rv = pd.DataFrame({"date_time": _date_key(volatility_df["date"]),
+                       "realized_volatility": volatility_df["realized_volatility"]})
+
+    dvol = pd.DataFrame({"date_time": _date_key(dvol_df["date_time"]), "close": dvol_df["close"]})
+    dvol["iv_daily"] = dvol["close"] / np.sqrt(365)  # Convert annualized IV to daily IV
+    dvol["iv_diff"] = dvol["close"] - dvol["close"].shift(1)
+
+    vrp = dvol[["date_time", "iv_daily"]].merge(rv, on="date_time", how="inner")
+    vrp["VRP"] = vrp["iv_daily"] - vrp["realized_volatility"]
+
+    greeks = pd.DataFrame({"date_time": _date_key(aggregated_greeks["date_only"])})
+    greeks[["Delta", "Gamma", "Vega"]] = aggregated_greeks[["Delta", "Gamma", "Vega"]].to_numpy()
+
+    final_df = (close_df[["date_time", "log_return"]]
+                .merge(dvol[["date_time", "iv_diff"]], on="date_time", how="left")
+                .merge(vrp[["date_time", "VRP"]], on="date_time", how="left")
+                .merge(greeks, on="date_time", how="left")
+                .dropna())
+    return final_df.set_index("date_time")[VAR_COLUMNS]
+
+
+# Python counterpart of `VAR(var_data, p = 1, type = "const")` in BtcVARModel.R.
+def fit_var(data, p=1):
+    """
+    Fit a VAR(p) with constant by equation-wise OLS.
+
+    Parameters:
+        data (pd.DataFrame): Endogenous variables, one column each, rows in time order.
+        p (int): Lag order.
+
+    Returns:
+        dict: "coef" and "t_values" DataFrames (equations x regressors), "residuals"
+        and the companion-matrix "roots" moduli used for the stability check.
+    """
+    with metrics.span("var", rows=len(data)) as var_span:
+        dropped = len(data) - len(data.dropna())
+        if dropped:
+            var_span.fail("dropped_incomplete_rows", dropped)
+        data = data.dropna()
+        values = data.to_numpy(dtype=float)
+        n_obs, k = values.shape
+        if n_obs <= p * k + 1:
+            raise ValueError(f"Not enough observations ({n_obs}) to fit a VAR({p}) with {k} variables.")
+
+        # Regressors: [y_{t-1}, ..., y_{t-p}, const], named as in R's vars package
+        Y = values[p:]
+        X = np.hstack([values[p - lag:n_obs - lag] for lag in range(1, p + 1)] + [np.ones((n_obs - p, 1))])
+        names = [f"{col}.l{lag}" for lag in range(1, p + 1) for col in data.columns] + ["const"]
+
+        beta, _, _, _ = np.linalg.lstsq(X, Y, rcond=None)
+        residuals = Y - X @ beta
+        dof = X.shape[0] - X.shape[1]
+        sigma2 = (residuals ** 2).sum(axis=0) / dof
+        xtx_inv_diag = np.diag(np.linalg.pinv(X.T @ X))
+        std_err = np.sqrt(np.outer(xtx_inv_diag, sigma2))
+
+        # Companion matrix eigenvalues; all moduli below 1 means the VAR is stable
+        companion = np.zeros((k * p, k * p))
+        companion[:k] = beta[:-1].T
+        companion[k:, :-k] = np.eye(k * (p - 1))
+        roots = np.sort(np.abs(np.linalg.eigvals(companion)))[::-1]
+
+        return {
+            "coef": pd.DataFrame(beta.T, index=data.columns, columns=names),
+            "t_values": pd.DataFrame((beta / std_err).T, index=data.columns, columns=names),
+            "residuals": pd.DataFrame(residuals, columns=data.columns, index=data.index[p:]),
+            "roots": roots,
+        }